@@ -9,14 +9,20 @@ from flask_socketio import SocketIO #update
 import eventlet #update
 
 eventlet.monkey_patch()
+# Imported only after patching so the pool's locks and semaphore are green
+from database.pool import db_pool, make_psycopg2_green
+make_psycopg2_green()
 app = Flask(__name__)
 logging.info("Flask app initialized")
 
+# Requests and socket events borrow one pooled connection, returned when their context ends
+app.teardown_appcontext(db_pool.release_request_connection)
+
 app.config["JWT_SECRET_KEY"] = JWT_SECRET_KEY
 jwt = JWTManager(app)
 
-# Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet') #update
+# Initialize SocketIO; with REDIS_URL set, emits from any worker reach clients connected to the others
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', message_queue=REDIS_URL or None) #update
 logging.info("SocketIO initialized") #update
 
 # Initialize Supabase client
@@ -40,6 +46,7 @@ with app.app_context():
     from controllers.user_onboarding_controller import *
     from controllers.swipe_controller import *
     from controllers.chat_controller import * #update
+    from controllers.recommendation_controller import *
     
 
 if __name__ == '__main__':
@@ -0,0 +1,124 @@
+"""
+Startup time, memory, per-query latency and ranking agreement of the embedding backends.
+
+Startup and peak RSS are measured in a fresh interpreter so import costs (torch) count.
+Ranking agreement is the mean overlap of each profile's top-k neighbours under a backend
+with its top-k under the reference backend (mpnet by default).
+
+    python -m benchmarks.embedder_benchmark --profiles 2000 --k 20
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+from config.config import EMBEDDING_MODEL_NAME, HASHED_EMBEDDING_DIMENSION
+from model.embedders import create_embedder
+
+CITIES = [
+    "Mumbai", "Delhi", "Bengaluru", "Goa", "Jaipur", "Manali", "Rishikesh", "Pune", "Kolkata",
+    "Chennai", "Udaipur", "Leh", "Shillong", "Varanasi", "Pondicherry", "Hyderabad"
+]
+INTERESTS = [
+    "hiking", "trekking", "beaches", "surfing", "food", "street food", "photography", "museums",
+    "history", "temples", "nightlife", "clubbing", "camping", "mountains", "yoga", "meditation",
+    "road trips", "biking", "wildlife", "safari", "scuba diving", "snorkeling", "shopping",
+    "architecture", "music festivals", "backpacking", "cafes", "skiing", "rafting", "reading"
+]
+
+STARTUP_SCRIPT = """
+import sys, json, time, resource
+started = time.perf_counter()
+from model.embedders import create_embedder
+embedder = create_embedder(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+embedder.embed_query("user has city Goa and love beaches, surfing")
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+}))
+"""
+
+
+def synthetic_profile_texts(count, seed=0):
+    """Profile sentences in the RecommendationModel.profile_text format"""
+    rng = np.random.default_rng(seed)
+    return [
+        f"user has city {rng.choice(CITIES)} and love "
+        f"{', '.join(rng.choice(INTERESTS, rng.integers(1, 5), replace=False))}"
+        for _ in range(count)
+    ]
+
+
+def measure_startup(backend):
+    process = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT, backend, EMBEDDING_MODEL_NAME, str(HASHED_EMBEDDING_DIMENSION)],
+        capture_output=True, text=True
+    )
+    if process.returncode:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def measure_queries(embedder, texts):
+    latencies = []
+    for text in texts:
+        started = time.perf_counter()
+        embedder.embed_query(text)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def neighbours(vectors, k):
+    """Top-k cosine neighbours of every row, excluding the row itself"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, -np.inf)
+    top = np.argpartition(-similarity, k, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def agreement(candidate, reference):
+    return np.mean([len(a & b) / len(b) for a, b in zip(candidate, reference)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the embedding backends")
+    parser.add_argument("--profiles", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--backends", nargs="+", default=["hashed", "huggingface"])
+    parser.add_argument("--reference", default="huggingface")
+    args = parser.parse_args()
+
+    texts = synthetic_profile_texts(args.profiles)
+    results = {}
+    for backend in args.backends:
+        try:
+            startup = measure_startup(backend)
+            embedder = create_embedder(backend, EMBEDDING_MODEL_NAME, HASHED_EMBEDDING_DIMENSION)
+        except Exception as e:
+            print(f"{backend}: could not load ({e})")
+            continue
+        p50, p99 = measure_queries(embedder, texts[:args.queries])
+        results[backend] = {
+            "startup": startup,
+            "p50": p50,
+            "p99": p99,
+            "neighbours": neighbours(embedder.embed_documents(texts), args.k)
+        }
+
+    reference = results.get(args.reference)
+    print(f"{args.profiles} profiles, k={args.k}, agreement against {args.reference}")
+    print(f"{'backend':<14}{'startup s':>11}{'peak MB':>10}{'p50 ms':>9}{'p99 ms':>9}{'agreement':>11}")
+    for backend, result in results.items():
+        overlap = f"{agreement(result['neighbours'], reference['neighbours']):.3f}" if reference else "-"
+        print(
+            f"{backend:<14}{result['startup']['seconds']:>11.2f}{result['startup']['peak_rss_mb']:>10.0f}"
+            f"{result['p50']:>9.3f}{result['p99']:>9.3f}{overlap:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Check that the /api/matches page query never falls back to a sequential scan.
+
+Runs EXPLAIN on the first page and on a keyset page for the user with the most active
+matches (or --user-id) and exits non-zero if any plan node is a Seq Scan. Sequential
+scans are disabled for the check, so one only shows up when no index can serve the
+query, which makes the result the same on a small development database as in production.
+
+    python -m benchmarks.explain_matches
+    python -m benchmarks.explain_matches --user-id 42 --analyze
+"""
+import sys
+import argparse
+from datetime import datetime
+from database.pool import db_pool
+from model.swipe_model import SwipeModel
+
+
+def busiest_user(cursor):
+    cursor.execute("""
+        SELECT user_id FROM (
+            SELECT user1_id AS user_id FROM matches WHERE is_active
+            UNION ALL
+            SELECT user2_id FROM matches WHERE is_active
+        ) sides
+        GROUP BY user_id
+        ORDER BY COUNT(*) DESC
+        LIMIT 1;
+    """)
+    row = cursor.fetchone()
+    return row['user_id'] if row else None
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(cursor, query, params, analyze):
+    cursor.execute(f"EXPLAIN (FORMAT JSON{', ANALYZE' if analyze else ''}) {query}", params)
+    plan = cursor.fetchone()[0][0]
+    return plan, list(plan_nodes(plan["Plan"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN the matches page query and fail on sequential scans")
+    parser.add_argument("--user-id", type=int)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--analyze", action="store_true", help="run the queries and report their timings")
+    args = parser.parse_args()
+
+    model = SwipeModel()
+    failed = False
+    with db_pool.cursor() as cursor:
+        user_id = args.user_id or busiest_user(cursor)
+        if user_id is None:
+            print("No active matches to explain")
+            return
+        cursor.execute("SET LOCAL enable_seqscan = off;")
+
+        pages = {
+            "first page": None,
+            "keyset page": (datetime.now(), 2 ** 31 - 1)
+        }
+        for name, page_cursor in pages.items():
+            query, params = model.matches_page_query(user_id, page_cursor, args.limit)
+            plan, nodes = explain(cursor, query, params, args.analyze)
+            seq_scans = [node.get("Relation Name") for node in nodes if node["Node Type"] == "Seq Scan"]
+            indexes = sorted({node["Index Name"] for node in nodes if "Index Name" in node})
+            timing = f", {plan['Execution Time']:.2f} ms" if args.analyze else ""
+            print(f"{name}: indexes {', '.join(indexes) or 'none'}{timing}")
+            if seq_scans:
+                failed = True
+                print(f"  sequential scan on {', '.join(seq_scans)}")
+        cursor.connection.rollback()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Recall and latency of the compressed vector index types against exact flat search.
+
+Synthetic profiles are unit vectors clustered around one centre per city, with a smaller
+offset per interest, which is roughly how the mpnet profile sentences spread out.
+
+    python -m benchmarks.index_benchmark --users 200000 --queries 500 --nprobe 8 16 32
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import faiss
+from model.vector_index import UserVectorIndex
+
+
+def synthetic_profiles(users, dimension, cities, interests, seed=0):
+    rng = np.random.default_rng(seed)
+    city_centres = rng.standard_normal((cities, dimension)).astype("float32")
+    interest_centres = rng.standard_normal((interests, dimension)).astype("float32")
+    city_of = rng.integers(0, cities, users)
+    interest_of = rng.integers(0, interests, users)
+    vectors = (
+        city_centres[city_of]
+        + 0.6 * interest_centres[interest_of]
+        + 0.3 * rng.standard_normal((users, dimension)).astype("float32")
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    metadata = [
+        {"city": f"city {city}", "username": f"user{i}", "interest_ids": [], "updated_at": 0.0}
+        for i, city in enumerate(city_of)
+    ]
+    return vectors, metadata
+
+
+def build(index_type, vectors, metadata, nprobe, nlist, pq_m):
+    index = UserVectorIndex(
+        os.path.join(tempfile.gettempdir(), f"bench_{index_type}.faiss"),
+        index_type=index_type, nlist=nlist, nprobe=nprobe, pq_m=pq_m
+    )
+    started = time.perf_counter()
+    index.build(list(range(len(vectors))), vectors, metadata)
+    return index, time.perf_counter() - started
+
+
+def measure(index, queries, k, exact):
+    latencies, recalls = [], []
+    for query, truth in zip(queries, exact):
+        started = time.perf_counter()
+        results = index.search(query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len({user_id for user_id, _ in results} & truth) / len(truth))
+    return np.mean(recalls), np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compressed vector index types")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--cities", type=int, default=300)
+    parser.add_argument("--interests", type=int, default=50)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--types", nargs="+", default=["sq8", "ivfsq8", "ivfpq"])
+    args = parser.parse_args()
+
+    vectors, metadata = synthetic_profiles(args.users, args.dimension, args.cities, args.interests)
+    queries = vectors[np.random.default_rng(1).choice(args.users, args.queries, replace=False)]
+
+    flat, build_seconds = build("flat", vectors, metadata, 0, 0, args.pq_m)
+    exact = [{user_id for user_id, _ in flat.search(query, args.k)} for query in queries]
+    recall, p50, p99 = measure(flat, queries, args.k, exact)
+
+    print(f"{args.users} users, {args.dimension} dims, k={args.k}")
+    print(f"{'index':<16}{'nprobe':>8}{'recall':>9}{'p50 ms':>9}{'p99 ms':>9}{'MB':>9}{'build s':>9}")
+    size = len(faiss.serialize_index(flat.index)) / 1e6
+    print(f"{'flat':<16}{'-':>8}{recall:>9.3f}{p50:>9.2f}{p99:>9.2f}{size:>9.1f}{build_seconds:>9.1f}")
+
+    for index_type in args.types:
+        index, build_seconds = build(index_type, vectors, metadata, args.nprobe[0], args.nlist, args.pq_m)
+        size = len(faiss.serialize_index(index.index)) / 1e6
+        ivf = faiss.try_extract_index_ivf(index.index)
+        if index_type.startswith("ivf") and ivf is None:
+            print(f"{index_type:<16} too few users to train, fell back to flat")
+            continue
+        for nprobe in (args.nprobe if ivf is not None else [None]):
+            if ivf is not None:
+                ivf.nprobe = nprobe
+            recall, p50, p99 = measure(index, queries, args.k, exact)
+            print(
+                f"{index_type:<16}{nprobe if nprobe else '-':>8}{recall:>9.3f}"
+                f"{p50:>9.2f}{p99:>9.2f}{size:>9.1f}{build_seconds:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
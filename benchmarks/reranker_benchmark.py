@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of the re-ranking stage on M candidates from a synthetic UserVectorIndex.
+
+Times what RecommendationModel.rerank runs per feed request: gathering the candidates'
+norms, interests, cities and profile timestamps from the index, then HybridReranker,
+which reads back only the diversity pool's vectors.
+
+    python -m benchmarks.reranker_benchmark --candidates 500 --k 50
+"""
+import time
+import argparse
+import numpy as np
+from model.reranker import HybridReranker, interest_ids
+from model.vector_index import UserVectorIndex
+
+
+def synthetic_index(users, dimension, cities, vocabulary, index_type, seed=0):
+    """In-memory index of users with random vectors, interests, cities and profile ages"""
+    rng = np.random.default_rng(seed)
+    words = [f"interest{i}" for i in range(vocabulary)]
+    now = time.time()
+    metadata = []
+    for user_id in range(users):
+        interests = ", ".join(rng.choice(words, rng.integers(1, 6), replace=False))
+        city = f"City{rng.integers(0, cities)}, Country"
+        metadata.append({
+            "username": f"user{user_id}",
+            "city": city,
+            "interests": interests,
+            "text": f"user has city {city} and love {interests}",
+            "interest_ids": interest_ids(interests),
+            "updated_at": now - rng.uniform(0, 90 * 86400)
+        })
+    index = UserVectorIndex("unused", index_type=index_type)
+    index.build(list(range(users)), rng.standard_normal((users, dimension)).astype("float32"), metadata)
+    return index
+
+
+def percentiles(timings):
+    return f"p50 {np.percentile(timings, 50):.3f} ms, p99 {np.percentile(timings, 99):.3f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the re-ranking stage")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--candidates", type=int, default=500)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--cities", type=int, default=20)
+    parser.add_argument("--vocabulary", type=int, default=200)
+    parser.add_argument("--index-type", default="flat", choices=UserVectorIndex.INDEX_TYPES)
+    parser.add_argument("--runs", type=int, default=500)
+    args = parser.parse_args()
+
+    index = synthetic_index(args.users, args.dimension, args.cities, args.vocabulary, args.index_type)
+    reranker = HybridReranker()
+    rng = np.random.default_rng(1)
+    query_vector = rng.standard_normal(args.dimension).astype("float32")
+    results = index.search(query_vector, args.candidates)
+    interests, city = "interest1, interest2, interest3, interest4", "City0, Country"
+
+    feature_timings, rerank_timings, stage_timings = [], [], []
+    for run in range(args.runs + 20):
+        # Same steps as RecommendationModel.rerank
+        started = time.perf_counter()
+        features = index.candidate_features(results)
+        gathered = time.perf_counter()
+        reranker.rerank(
+            args.k,
+            query_vector=query_vector,
+            user_interest_ids=interest_ids(interests),
+            user_city=index.city_code(city),
+            **features
+        )
+        finished = time.perf_counter()
+        # The first runs only warm up caches
+        if run >= 20:
+            feature_timings.append((gathered - started) * 1000)
+            rerank_timings.append((finished - gathered) * 1000)
+            stage_timings.append((finished - started) * 1000)
+
+    print(f"M={len(results)} k={args.k} d={args.dimension} index={args.index_type}")
+    print(f"  features {percentiles(feature_timings)}")
+    print(f"  rerank   {percentiles(rerank_timings)}")
+    print(f"  stage    {percentiles(stage_timings)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,4 +12,62 @@ POSTGRES_USER = os.getenv("POSTGRES_USER")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT")
 
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
\ No newline at end of file
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+
+# Recommendation engine
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "huggingface")  # huggingface or hashed
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-mpnet-base-v2")
+HASHED_EMBEDDING_DIMENSION = int(os.getenv("HASHED_EMBEDDING_DIMENSION", "512"))
+# Backends produce different vector spaces, so each keeps its own index and embedding cache
+VECTOR_STORE_DIR = os.path.join(
+    os.getcwd(), "vector_store", *([] if EMBEDDING_BACKEND == "huggingface" else [EMBEDDING_BACKEND])
+)
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", os.path.join(VECTOR_STORE_DIR, "user_index.faiss"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(VECTOR_STORE_DIR, "profile_embeddings"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+PROFILE_EMBEDDING_BATCH_SIZE = int(os.getenv("PROFILE_EMBEDDING_BATCH_SIZE", "64"))
+PROFILE_EMBEDDING_BATCH_WAIT_MS = int(os.getenv("PROFILE_EMBEDDING_BATCH_WAIT_MS", "500"))
+RECOMMENDATION_STALE_AFTER_HOURS = float(os.getenv("RECOMMENDATION_STALE_AFTER_HOURS", "24"))
+RECOMMENDATION_PAGE_SIZE = int(os.getenv("RECOMMENDATION_PAGE_SIZE", "20"))
+RECOMMENDATION_OVERFETCH_FACTOR = int(os.getenv("RECOMMENDATION_OVERFETCH_FACTOR", "3"))
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")  # flat, sq8, ivfsq8 or ivfpq
+VECTOR_INDEX_NLIST = int(os.getenv("VECTOR_INDEX_NLIST", "0"))  # 0 picks 4 * sqrt(users)
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+VECTOR_INDEX_PQ_M = int(os.getenv("VECTOR_INDEX_PQ_M", "48"))  # bytes per vector for ivfpq
+VECTOR_INDEX_COMPACT_AFTER = int(os.getenv("VECTOR_INDEX_COMPACT_AFTER", "1000"))  # log entries before a new snapshot
+# Unix socket of the shared embedding service, empty loads the model inside every worker
+EMBEDDING_SERVICE_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET", "")
+CPU_OFFLOAD_MAX_PENDING = int(os.getenv("CPU_OFFLOAD_MAX_PENDING", "8"))
+CPU_OFFLOAD_WAIT_SECONDS = float(os.getenv("CPU_OFFLOAD_WAIT_SECONDS", "2"))
+# ANN candidates handed to the hybrid re-ranker before it picks the final list
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "200"))
+# Per-user cache of stored recommendation lists, 0 disables it. Set REDIS_URL to share it across workers
+RECOMMENDATION_CACHE_TTL_SECONDS = int(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "300"))
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "10000"))
+REDIS_URL = os.getenv("REDIS_URL", "")
+# Postgres connection pool per process
+DB_POOL_MIN_CONNECTIONS = int(os.getenv("DB_POOL_MIN_CONNECTIONS", "1"))
+DB_POOL_MAX_CONNECTIONS = int(os.getenv("DB_POOL_MAX_CONNECTIONS", "10"))
+DB_POOL_WAIT_SECONDS = float(os.getenv("DB_POOL_WAIT_SECONDS", "5"))
+DB_POOL_HEALTHCHECK_IDLE_SECONDS = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE_SECONDS", "30"))
+# username -> user_id lookups of other users, cached per worker
+USER_ID_CACHE_TTL_SECONDS = int(os.getenv("USER_ID_CACHE_TTL_SECONDS", "600"))
+USER_ID_CACHE_SIZE = int(os.getenv("USER_ID_CACHE_SIZE", "50000"))
+# Sliding-window swipe quota: redis, database (count under an advisory lock) or memory (one worker only)
+SWIPE_QUOTA_BACKEND = os.getenv("SWIPE_QUOTA_BACKEND", "redis" if REDIS_URL else "database")
+SWIPE_DAILY_LIMIT = int(os.getenv("SWIPE_DAILY_LIMIT", "10"))
+SWIPE_QUOTA_WINDOW_SECONDS = int(os.getenv("SWIPE_QUOTA_WINDOW_SECONDS", "86400"))
+SWIPE_QUOTA_CACHE_SIZE = int(os.getenv("SWIPE_QUOTA_CACHE_SIZE", "100000"))
+# Most swipes accepted by one /api/swipes/batch request
+MAX_SWIPE_BATCH_SIZE = int(os.getenv("MAX_SWIPE_BATCH_SIZE", "100"))
+# Matches returned per /api/matches page
+MATCHES_PAGE_SIZE = int(os.getenv("MATCHES_PAGE_SIZE", "50"))
+# Weekly swipe_logs partitions, older ones are rolled up into swipe_history and dropped
+SWIPE_LOG_RETENTION_DAYS = int(os.getenv("SWIPE_LOG_RETENTION_DAYS", "35"))
+SWIPE_LOG_PARTITIONS_AHEAD_WEEKS = int(os.getenv("SWIPE_LOG_PARTITIONS_AHEAD_WEEKS", "4"))
+# Acknowledge left swipes at once and insert them in batches from a per-worker buffer
+SWIPE_WRITE_BEHIND = os.getenv("SWIPE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+SWIPE_WRITE_BEHIND_MAX_ROWS = int(os.getenv("SWIPE_WRITE_BEHIND_MAX_ROWS", "500"))
+SWIPE_WRITE_BEHIND_MAX_WAIT_MS = int(os.getenv("SWIPE_WRITE_BEHIND_MAX_WAIT_MS", "200"))
+# Messages returned per /api/chat/history page
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50"))
@@ -2,8 +2,9 @@ from flask import request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_socketio import emit, join_room, leave_room
 from model.chat_model import ChatModel
-from utils.get_user_id import get_user_id_from_username
+from utils.get_user_id import get_user_id_from_username, get_current_user_id
 from utils.logger import logging
+from config.config import CHAT_HISTORY_PAGE_SIZE
 from app import app, socketio
 
 chat_model = ChatModel()
@@ -17,7 +18,7 @@ def handle_connect():
         if not username:
             return False  # Reject connection if no valid token
         
-        user_id = get_user_id_from_username(username)
+        user_id = get_current_user_id()
         if not user_id:
             return False
         
@@ -35,7 +36,7 @@ def handle_disconnect():
     try:
         username = get_jwt_identity()
         if username:
-            user_id = get_user_id_from_username(username)
+            user_id = get_current_user_id()
             if user_id:
                 leave_room(f"user_{user_id}")
                 logging.info(f"User {username} disconnected from WebSocket")
@@ -51,7 +52,7 @@ def handle_join_chat(data):
         
         # Get current user's info
         username = get_jwt_identity()
-        user_id = get_user_id_from_username(username)
+        user_id = get_current_user_id()
         other_user_id = get_user_id_from_username(other_username)
         
         if not all([user_id, other_user_id]):
@@ -73,7 +74,7 @@ def handle_leave_chat(data):
             return
         
         username = get_jwt_identity()
-        user_id = get_user_id_from_username(username)
+        user_id = get_current_user_id()
         other_user_id = get_user_id_from_username(other_username)
         
         if not all([user_id, other_user_id]):
@@ -97,7 +98,7 @@ def handle_new_message(data):
         
         # Get user IDs
         sender_username = get_jwt_identity()
-        sender_id = get_user_id_from_username(sender_username)
+        sender_id = get_current_user_id()
         receiver_id = get_user_id_from_username(receiver_username)
         
         if not all([sender_id, receiver_id]):
@@ -145,7 +146,7 @@ def send_message():
         sender_username = get_jwt_identity()
         
         # Get user IDs
-        sender_id = get_user_id_from_username(sender_username)
+        sender_id = get_current_user_id()
         receiver_id = get_user_id_from_username(receiver_username)
 
         if not all([sender_id, receiver_id]):
@@ -191,11 +192,29 @@ def get_chat_history():
                 "message": "Username parameter is required"
             }), 400
 
+        try:
+            before, after = (
+                int(request.args[name]) if request.args.get(name) else None for name in ('before', 'after')
+            )
+            limit = min(max(int(request.args.get('limit', CHAT_HISTORY_PAGE_SIZE)), 1), 200)
+            if any(message_id is not None and message_id <= 0 for message_id in (before, after)):
+                raise ValueError("Message ids start at 1")
+        except ValueError:
+            return jsonify({
+                "status": "error",
+                "message": "Invalid before, after or limit"
+            }), 400
+        if before is not None and after is not None:
+            return jsonify({
+                "status": "error",
+                "message": "Use either before or after, not both"
+            }), 400
+
         # Get current user's username from JWT
         username = get_jwt_identity()
         
         # Get user IDs
-        user_id = get_user_id_from_username(username)
+        user_id = get_current_user_id()
         other_user_id = get_user_id_from_username(other_username)
 
         if not all([user_id, other_user_id]):
@@ -204,7 +223,7 @@ def get_chat_history():
                 "message": "User not found"
             }), 404
 
-        result = chat_model.get_chat_history(user_id, other_user_id)
+        result = chat_model.get_chat_history(user_id, other_user_id, before, after, limit)
         
         if result["status"] == "success":
             return jsonify(result), 200
@@ -223,7 +242,7 @@ def get_recent_chats():
     try:
         # Get current user's username from JWT
         username = get_jwt_identity()
-        user_id = get_user_id_from_username(username)
+        user_id = get_current_user_id()
 
         if not user_id:
             return jsonify({
@@ -249,7 +268,7 @@ def get_recent_chats():
 def delete_message(message_id):
     try:
         username = get_jwt_identity()
-        user_id = get_user_id_from_username(username)
+        user_id = get_current_user_id()
 
         if not user_id:
             return jsonify({
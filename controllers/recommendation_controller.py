@@ -0,0 +1,112 @@
+from app import app, socketio
+from flask import jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import datetime, timedelta
+from config.config import RECOMMENDATION_STALE_AFTER_HOURS, RECOMMENDATION_PAGE_SIZE
+from model.recommendation_model import RecommendationModel
+from model.swipe_quota import swipe_quota
+from utils.get_user_id import get_current_user_id, user_id_cache
+from utils.logger import logging
+
+# Usernames whose live recommendation refresh is already running in this worker
+refreshing_users = set()
+
+
+def refresh_recommendations_in_background(username):
+    """Compute and store a fresh list without holding up the feed request"""
+    try:
+        RecommendationModel().get_recommendations(username)
+    except Exception as e:
+        logging.error(f"Error refreshing recommendations for {username}: {e}")
+    finally:
+        refreshing_users.discard(username)
+
+
+def schedule_refresh(username):
+    if username in refreshing_users:
+        return
+    refreshing_users.add(username)
+    socketio.start_background_task(refresh_recommendations_in_background, username)
+
+
+def parse_cursor(raw_cursor):
+    """Cursor is "<rank>:<recommended_user_id>" of the last card the client saw"""
+    if not raw_cursor:
+        return None
+    rank, recommended_user_id = raw_cursor.split(':')
+    return int(rank), int(recommended_user_id)
+
+
+@app.route('/api/recommendations', methods=['GET', 'POST'])
+@jwt_required()
+def get_recommendations():
+    try:
+        try:
+            cursor = parse_cursor(request.args.get('cursor'))
+            limit = min(max(int(request.args.get('limit', RECOMMENDATION_PAGE_SIZE)), 1), 100)
+        except ValueError:
+            return jsonify({
+                "status": "error",
+                "message": "Invalid cursor or limit"
+            }), 400
+
+        username = get_jwt_identity()
+        user_id = get_current_user_id()
+
+        if not user_id:
+            return jsonify({
+                "status": "error",
+                "message": "User not found"
+            }), 404
+
+        recommendation_model = RecommendationModel()
+        result = recommendation_model.get_stored_recommendations(user_id, cursor, limit)
+
+        if result["status"] != "success":
+            return jsonify(result), 400
+
+        # Only the first page decides whether the stored list needs recomputing
+        refreshing = False
+        if cursor is None:
+            generated_at = result["generated_at"]
+            stale_before = datetime.now() - timedelta(hours=RECOMMENDATION_STALE_AFTER_HOURS)
+            if generated_at is None or generated_at < stale_before:
+                schedule_refresh(username)
+                refreshing = True
+
+        next_cursor = result["next_cursor"]
+        return jsonify({
+            "status": "success",
+            "recommendations": result["recommendations"],
+            "next_cursor": f"{next_cursor[0]}:{next_cursor[1]}" if next_cursor else None,
+            "generated_at": result["generated_at"].isoformat() if result["generated_at"] else None,
+            "refreshing": refreshing
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error in get_recommendations: {e}")
+        return jsonify({
+            "status": "error",
+            "message": "An error occurred while fetching recommendations"
+        }), 500
+
+
+@app.route('/api/recommendations/stats', methods=['GET'])
+@jwt_required()
+def get_recommendation_stats():
+    """Cache hit rates, entry counts and pool usage of this worker, for sizing the caches and the pool"""
+    try:
+        return jsonify({
+            "status": "success",
+            "stats": {
+                **RecommendationModel.cache_stats(),
+                "user_ids": user_id_cache.stats(),
+                "swipe_quota": swipe_quota.stats()
+            }
+        }), 200
+    except Exception as e:
+        logging.error(f"Error in get_recommendation_stats: {e}")
+        return jsonify({
+            "status": "error",
+            "message": "An error occurred while collecting recommendation stats"
+        }), 500
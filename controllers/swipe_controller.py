@@ -1,18 +1,28 @@
-from app import app
+from app import app, socketio
 from flask import jsonify, request
 from model.swipe_model import SwipeModel
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from utils.logger import logging
-from utils.get_user_id import get_user_id_from_username
+from utils.get_user_id import get_user_id_from_username, get_current_user_id
+from config.config import MAX_SWIPE_BATCH_SIZE, MATCHES_PAGE_SIZE
+from datetime import datetime
 
 swipe_model = SwipeModel()
 
+def emit_match_events(match_ids):
+    """Push a 'match' event to both users' personal rooms, never fails the swipe itself"""
+    try:
+        for recipient_id, payload in swipe_model.get_match_events(match_ids):
+            socketio.emit('match', payload, room=f"user_{recipient_id}")
+    except Exception as e:
+        logging.error(f"Error emitting match events for {match_ids}: {e}")
+
 @app.route('/api/swipes/remaining', methods=['POST'])
 @jwt_required()
 def get_remaining_swipes():
     try:
         username = get_jwt_identity()
-        user_id = get_user_id_from_username(username)
+        user_id = get_current_user_id()
         
         if not user_id:
             return jsonify({
@@ -46,7 +56,7 @@ def process_swipe():
             
         # Get user IDs
         username = get_jwt_identity()
-        user_id = get_user_id_from_username(username)
+        user_id = get_current_user_id()
         target_user_id = get_user_id_from_username(target_username)
         
         if not all([user_id, target_user_id]):
@@ -56,6 +66,8 @@ def process_swipe():
             }), 404
             
         result = swipe_model.process_swipe(user_id, target_user_id, direction)
+        if result["status"] == "success" and result["match_id"]:
+            emit_match_events([result["match_id"]])
         return jsonify(result), 200 if result["status"] == "success" else 400
         
     except Exception as e:
@@ -65,12 +77,68 @@ def process_swipe():
             "message": str(e)
         }), 500
 
+@app.route('/api/swipes/batch', methods=['POST'])
+@jwt_required()
+def process_swipe_batch():
+    """Replay swipes a client queued while offline, in order, with one result per swipe"""
+    try:
+        data = request.get_json() or {}
+        swipes = data.get('swipes')
+
+        if not isinstance(swipes, list) or not swipes or len(swipes) > MAX_SWIPE_BATCH_SIZE \
+                or not all(isinstance(swipe, dict) for swipe in swipes):
+            return jsonify({
+                "status": "error",
+                "message": f"Invalid request. Required: swipes, a list of 1-{MAX_SWIPE_BATCH_SIZE} "
+                           "{target_username, direction (left/right)} objects"
+            }), 400
+
+        user_id = get_current_user_id()
+        if not user_id:
+            return jsonify({
+                "status": "error",
+                "message": "User not found"
+            }), 404
+
+        result = swipe_model.process_swipe_batch(
+            user_id, [(swipe.get('target_username'), swipe.get('direction')) for swipe in swipes]
+        )
+        if result["status"] == "success":
+            emit_match_events([item["match_id"] for item in result["results"] if item.get("match_id")])
+        return jsonify(result), 200 if result["status"] == "success" else 400
+
+    except Exception as e:
+        logging.error(f"Error in process_swipe_batch: {e}")
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
+
+def parse_match_cursor(raw_cursor):
+    """Cursor is "<matched_at ISO timestamp>:<match_id>" of the last match the client saw"""
+    if not raw_cursor:
+        return None
+    matched_at, match_id = raw_cursor.rsplit(':', 1)
+    matched_at, match_id = datetime.fromisoformat(matched_at), int(match_id)
+    if match_id <= 0:
+        raise ValueError(f"Invalid match_id in cursor {raw_cursor}")
+    return matched_at, match_id
+
 @app.route('/api/matches', methods=['POST'])
 @jwt_required()
 def get_matches():
     try:
+        try:
+            cursor = parse_match_cursor(request.args.get('cursor'))
+            limit = min(max(int(request.args.get('limit', MATCHES_PAGE_SIZE)), 1), 100)
+        except ValueError:
+            return jsonify({
+                "status": "error",
+                "message": "Invalid cursor or limit"
+            }), 400
+
         username = get_jwt_identity()
-        user_id = get_user_id_from_username(username)
+        user_id = get_current_user_id()
         
         if not user_id:
             return jsonify({
@@ -78,7 +146,7 @@ def get_matches():
                 "message": "User not found"
             }), 404
             
-        result = swipe_model.get_matches(user_id)
+        result = swipe_model.get_matches(user_id, cursor, limit)
         return jsonify(result), 200 if result["status"] == "success" else 400
         
     except Exception as e:
@@ -88,3 +156,34 @@ def get_matches():
             "message": str(e)
         }), 500
 
+
+@app.route('/api/matches/delta', methods=['GET', 'POST'])
+@jwt_required()
+def get_matches_delta():
+    """Matches created after the client's cursor, for catching up on missed 'match' events"""
+    try:
+        try:
+            after_match_id = int(request.args.get('cursor', 0))
+            limit = min(max(int(request.args.get('limit', 50)), 1), 100)
+        except ValueError:
+            return jsonify({
+                "status": "error",
+                "message": "Invalid cursor or limit"
+            }), 400
+
+        user_id = get_current_user_id()
+        if not user_id:
+            return jsonify({
+                "status": "error",
+                "message": "User not found"
+            }), 404
+
+        result = swipe_model.get_matches_since(user_id, after_match_id, limit)
+        return jsonify(result), 200 if result["status"] == "success" else 400
+
+    except Exception as e:
+        logging.error(f"Error in get_matches_delta: {e}")
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
@@ -0,0 +1,3 @@
+-- Keyset pagination of the swipe deck: WHERE user_id = ? AND (rank, recommended_user_id) > (?, ?)
+CREATE INDEX IF NOT EXISTS idx_recommendation_entries_feed
+    ON user_recommendation_entries (user_id, rank, recommended_user_id);
@@ -0,0 +1,7 @@
+-- Loading a user's already swiped / matched ids when filtering recommendation candidates
+CREATE INDEX IF NOT EXISTS idx_swipe_logs_user_target
+    ON swipe_logs (user_id, target_user_id);
+
+-- unique_match already covers lookups by user1_id
+CREATE INDEX IF NOT EXISTS idx_matches_user2
+    ON matches (user2_id, user1_id);
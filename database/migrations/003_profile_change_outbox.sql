@@ -0,0 +1,9 @@
+-- Users whose location or interests changed since their vector was last refreshed.
+-- Written in the same transaction as the profile update, drained by
+-- RecommendationModel.drain_profile_changes (python -m jobs.profile_change_consumer).
+CREATE TABLE IF NOT EXISTS profile_change_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INT NOT NULL,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES user_db(id) ON DELETE CASCADE
+);
@@ -0,0 +1,7 @@
+-- Loading one user's swipe quota window: WHERE user_id = ? AND swiped_at > ?
+CREATE INDEX IF NOT EXISTS idx_swipe_logs_user_swiped_at
+    ON swipe_logs (user_id, swiped_at);
+
+-- Reconciling every window that has swipes in the last day
+CREATE INDEX IF NOT EXISTS idx_swipe_logs_swiped_at
+    ON swipe_logs (swiped_at);
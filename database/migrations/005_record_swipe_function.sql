@@ -0,0 +1,39 @@
+-- One round trip per swipe: log it, look for the reciprocal right swipe and create the match.
+-- Right swipes take a transaction-level advisory lock on the user pair, and every statement
+-- in a plpgsql function reads a fresh snapshot, so when two users swipe right on each other
+-- at the same moment the second one waits, sees the first swipe and creates the match.
+-- new_match_id is NULL when there is no match or the pair was already matched.
+CREATE OR REPLACE FUNCTION record_swipe(
+    p_user_id INT,
+    p_target_user_id INT,
+    p_direction swipe_direction_enum
+)
+RETURNS TABLE (new_swipe_id INT, new_match_id INT)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF p_direction = 'right' THEN
+        PERFORM pg_advisory_xact_lock(LEAST(p_user_id, p_target_user_id), GREATEST(p_user_id, p_target_user_id));
+    END IF;
+
+    INSERT INTO swipe_logs (user_id, target_user_id, swipe_direction)
+    VALUES (p_user_id, p_target_user_id, p_direction)
+    RETURNING swipe_id INTO new_swipe_id;
+
+    IF p_direction = 'right' AND EXISTS (
+        SELECT 1
+        FROM swipe_logs
+        WHERE user_id = p_target_user_id
+        AND target_user_id = p_user_id
+        AND swipe_direction = 'right'
+        AND swiped_at > NOW() - INTERVAL '7 days'
+    ) THEN
+        INSERT INTO matches (user1_id, user2_id)
+        VALUES (LEAST(p_user_id, p_target_user_id), GREATEST(p_user_id, p_target_user_id))
+        ON CONFLICT (user1_id, user2_id) DO NOTHING
+        RETURNING match_id INTO new_match_id;
+    END IF;
+
+    RETURN NEXT;
+END;
+$$;
@@ -0,0 +1,62 @@
+-- Batch form of record_swipe: one call logs every swipe of a batch and creates the matches.
+-- Rows come back in batch order (batch_index is 1-based). Pair locks are the same as
+-- record_swipe's and are taken in one global order, so concurrent batches cannot deadlock.
+-- swipe_ids of one INSERT come from the sequence in insert order, which numbers the rows.
+CREATE OR REPLACE FUNCTION record_swipes(
+    p_user_id INT,
+    p_target_user_ids INT[],
+    p_directions swipe_direction_enum[]
+)
+RETURNS TABLE (batch_index INT, new_swipe_id INT, new_match_id INT)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(pair.low, pair.high)
+    FROM (
+        SELECT DISTINCT LEAST(p_user_id, t) AS low, GREATEST(p_user_id, t) AS high
+        FROM unnest(p_target_user_ids, p_directions) AS s(t, d)
+        WHERE d = 'right'
+        ORDER BY low, high
+    ) AS pair;
+
+    RETURN QUERY
+    WITH batch AS (
+        SELECT s.t AS target_user_id, s.d AS direction, s.ord
+        FROM unnest(p_target_user_ids, p_directions) WITH ORDINALITY AS s(t, d, ord)
+    ),
+    inserted AS (
+        INSERT INTO swipe_logs (user_id, target_user_id, swipe_direction)
+        SELECT p_user_id, b.target_user_id, b.direction
+        FROM batch b
+        ORDER BY b.ord
+        RETURNING swipe_logs.swipe_id, swipe_logs.target_user_id, swipe_logs.swipe_direction
+    ),
+    numbered AS (
+        SELECT i.*, row_number() OVER (ORDER BY i.swipe_id) AS ord
+        FROM inserted i
+    ),
+    matched AS (
+        INSERT INTO matches (user1_id, user2_id)
+        SELECT DISTINCT LEAST(p_user_id, n.target_user_id), GREATEST(p_user_id, n.target_user_id)
+        FROM numbered n
+        WHERE n.swipe_direction = 'right'
+        AND EXISTS (
+            SELECT 1
+            FROM swipe_logs r
+            WHERE r.user_id = n.target_user_id
+            AND r.target_user_id = p_user_id
+            AND r.swipe_direction = 'right'
+            AND r.swiped_at > NOW() - INTERVAL '7 days'
+        )
+        ON CONFLICT (user1_id, user2_id) DO NOTHING
+        RETURNING matches.match_id, matches.user1_id, matches.user2_id
+    )
+    SELECT n.ord::INT, n.swipe_id, m.match_id
+    FROM numbered n
+    LEFT JOIN matched m
+        ON n.swipe_direction = 'right'
+        AND m.user1_id = LEAST(p_user_id, n.target_user_id)
+        AND m.user2_id = GREATEST(p_user_id, n.target_user_id)
+    ORDER BY n.ord;
+END;
+$$;
@@ -0,0 +1,9 @@
+-- Newest-first pages of a user's active matches, one index per side of the pair:
+-- WHERE userN_id = ? AND is_active AND (matched_at, match_id) < (?, ?) ORDER BY matched_at DESC, match_id DESC
+CREATE INDEX IF NOT EXISTS idx_matches_user1_recent
+    ON matches (user1_id, matched_at DESC, match_id DESC)
+    WHERE is_active;
+
+CREATE INDEX IF NOT EXISTS idx_matches_user2_recent
+    ON matches (user2_id, matched_at DESC, match_id DESC)
+    WHERE is_active;
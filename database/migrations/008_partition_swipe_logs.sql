@@ -0,0 +1,83 @@
+-- swipe_logs becomes range partitioned by week of swiped_at (swipe_logs_YYYYMMDD, Monday
+-- start). The quota window (24 hours) and the reciprocal right swipe check (7 days) each
+-- touch at most two partitions. Partitions older than the retention period are rolled up
+-- into swipe_history, one row per (user_id, target_user_id) with the last direction, which
+-- keeps "already swiped" deduplication complete, and then dropped by
+-- python -m jobs.maintain_swipe_logs. Existing rows older than 5 weeks go straight to
+-- swipe_history.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS swipe_history (
+    user_id INT NOT NULL,
+    target_user_id INT NOT NULL,
+    last_direction swipe_direction_enum NOT NULL,
+    last_swiped_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, target_user_id),
+    FOREIGN KEY (user_id) REFERENCES user_db(id) ON DELETE CASCADE,
+    FOREIGN KEY (target_user_id) REFERENCES user_db(id) ON DELETE CASCADE
+);
+
+-- Keep the id sequence when the old table is dropped, new swipes continue its numbering
+ALTER SEQUENCE swipe_logs_swipe_id_seq OWNED BY NONE;
+ALTER TABLE swipe_logs RENAME TO swipe_logs_unpartitioned;
+
+CREATE TABLE swipe_logs (
+    swipe_id INT NOT NULL DEFAULT nextval('swipe_logs_swipe_id_seq'),
+    user_id INT NOT NULL,
+    target_user_id INT NOT NULL,
+    swipe_direction swipe_direction_enum NOT NULL,
+    swiped_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (swipe_id, swiped_at),
+    FOREIGN KEY (user_id) REFERENCES user_db(id) ON DELETE CASCADE,
+    FOREIGN KEY (target_user_id) REFERENCES user_db(id) ON DELETE CASCADE
+) PARTITION BY RANGE (swiped_at);
+
+ALTER SEQUENCE swipe_logs_swipe_id_seq OWNED BY swipe_logs.swipe_id;
+
+-- Weekly partitions covering [p_from, p_to), existing ones are left alone; returns how many were created
+CREATE OR REPLACE FUNCTION create_swipe_log_partitions(p_from DATE, p_to DATE)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    week_start DATE := date_trunc('week', p_from)::DATE;
+    partition_name TEXT;
+    created INT := 0;
+BEGIN
+    WHILE week_start < p_to LOOP
+        partition_name := format('swipe_logs_%s', to_char(week_start, 'YYYYMMDD'));
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF swipe_logs FOR VALUES FROM (%L) TO (%L)',
+                partition_name, week_start, week_start + 7
+            );
+            created := created + 1;
+        END IF;
+        week_start := week_start + 7;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+SELECT create_swipe_log_partitions((LOCALTIMESTAMP - INTERVAL '35 days')::DATE, (LOCALTIMESTAMP + INTERVAL '28 days')::DATE);
+
+INSERT INTO swipe_history (user_id, target_user_id, last_direction, last_swiped_at)
+SELECT DISTINCT ON (user_id, target_user_id)
+       user_id, target_user_id, swipe_direction, COALESCE(swiped_at, LOCALTIMESTAMP)
+FROM swipe_logs_unpartitioned
+WHERE swiped_at < date_trunc('week', LOCALTIMESTAMP - INTERVAL '35 days')
+ORDER BY user_id, target_user_id, swiped_at DESC, swipe_id DESC;
+
+INSERT INTO swipe_logs (swipe_id, user_id, target_user_id, swipe_direction, swiped_at)
+SELECT swipe_id, user_id, target_user_id, swipe_direction, COALESCE(swiped_at, LOCALTIMESTAMP)
+FROM swipe_logs_unpartitioned
+WHERE swiped_at IS NULL OR swiped_at >= date_trunc('week', LOCALTIMESTAMP - INTERVAL '35 days');
+
+DROP TABLE swipe_logs_unpartitioned;
+
+-- Created on the parent, so every partition gets them (see migrations 002 and 004)
+CREATE INDEX idx_swipe_logs_user_target ON swipe_logs (user_id, target_user_id);
+CREATE INDEX idx_swipe_logs_user_swiped_at ON swipe_logs (user_id, swiped_at);
+CREATE INDEX idx_swipe_logs_swiped_at ON swipe_logs (swiped_at);
+
+COMMIT;
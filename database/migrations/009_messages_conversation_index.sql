@@ -0,0 +1,9 @@
+-- Chat history pages: WHERE LEAST(sender_id, receiver_id) = ? AND GREATEST(sender_id, receiver_id) = ?
+-- AND (sent_at, message_id) < / > (?, ?) ORDER BY sent_at, message_id, read in either direction
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_sent_at
+    ON messages (LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id), sent_at, message_id);
+
+-- Marking a conversation's received messages read only visits the unread ones
+CREATE INDEX IF NOT EXISTS idx_messages_unread
+    ON messages (receiver_id, sender_id)
+    WHERE status <> 'read';
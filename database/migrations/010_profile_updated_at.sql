@@ -0,0 +1,17 @@
+-- When each profile was last saved, the re-ranker's recency signal. Stored with the
+-- profile's vector index entry as EXTRACT(EPOCH FROM updated_at). Existing rows start
+-- at the time this migration runs.
+ALTER TABLE user_profile ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+-- Onboarding saves are INSERT ... ON CONFLICT DO UPDATE, which fires this as well
+CREATE OR REPLACE FUNCTION touch_user_profile() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS user_profile_touch ON user_profile;
+CREATE TRIGGER user_profile_touch
+    BEFORE UPDATE ON user_profile
+    FOR EACH ROW EXECUTE FUNCTION touch_user_profile();
@@ -0,0 +1,48 @@
+-- Safety net for the weekly swipe_logs partitions of migration 008: swipes for a week
+-- nobody created a partition for land in swipe_logs_default instead of failing the
+-- INSERT. create_swipe_log_partitions now moves a week's rows out of the default
+-- partition when it creates that week, so python -m jobs.maintain_swipe_logs catching
+-- up after missed runs leaves every swipe in its own week.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS swipe_logs_default PARTITION OF swipe_logs DEFAULT;
+
+-- Weekly partitions covering [p_from, p_to), existing ones are left alone; returns how many were created
+CREATE OR REPLACE FUNCTION create_swipe_log_partitions(p_from DATE, p_to DATE)
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    week_start DATE := date_trunc('week', p_from)::DATE;
+    partition_name TEXT;
+    created INT := 0;
+BEGIN
+    WHILE week_start < p_to LOOP
+        partition_name := format('swipe_logs_%s', to_char(week_start, 'YYYYMMDD'));
+        IF to_regclass(partition_name) IS NULL THEN
+            -- A partition cannot be created over rows the default partition holds for its
+            -- range, so the week is filled from the default partition before it is attached
+            EXECUTE format(
+                'CREATE TABLE %I (LIKE swipe_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                partition_name
+            );
+            EXECUTE format(
+                'WITH moved AS (
+                    DELETE FROM swipe_logs_default WHERE swiped_at >= %L AND swiped_at < %L RETURNING *
+                 )
+                 INSERT INTO %I SELECT * FROM moved',
+                week_start, week_start + 7, partition_name
+            );
+            EXECUTE format(
+                'ALTER TABLE swipe_logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, week_start, week_start + 7
+            );
+            created := created + 1;
+        END IF;
+        week_start := week_start + 7;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+COMMIT;
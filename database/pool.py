@@ -0,0 +1,230 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import DictCursor
+from psycopg2.pool import ThreadedConnectionPool
+from flask import g, has_app_context
+from config.config import *
+from utils.metrics import LatencyStats
+from utils.logger import logging
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the wait timeout"""
+
+
+def eventlet_wait_callback(connection, timeout=None):
+    """psycopg2 wait callback that parks only the current greenlet while Postgres works"""
+    from eventlet.hubs import trampoline
+
+    while True:
+        state = connection.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            trampoline(connection.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(connection.fileno(), write=True)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state}")
+
+
+def make_psycopg2_green():
+    """
+    Let other greenlets run while a query waits on the network. Without it every query
+    blocks the whole eventlet hub, so a worker's requests reach Postgres one at a time.
+    COPY is not available on green connections, the batch jobs run without this.
+    """
+    extensions.set_wait_callback(eventlet_wait_callback)
+
+
+class DatabasePool:
+    """
+    Postgres connections shared by every model in the process.
+
+    Keeps min_connections open and never more than max_connections; callers beyond that
+    wait up to wait_seconds for a connection to come back and then get PoolTimeout.
+    A connection idle for longer than healthcheck_idle_seconds is pinged before it is
+    handed out and replaced if the server dropped it. Returned connections are rolled
+    back so no transaction leaks into the next borrower. The pool is created lazily in
+    the process that uses it, so gunicorn workers never share sockets forked from the master.
+
+    Inside a Flask request or Socket.IO event every block borrows the same connection,
+    held on flask.g until the request's app context is torn down (see
+    release_request_connection). Each request or event has its own context, so
+    concurrent greenlets never share a connection or a transaction.
+    """
+
+    def __init__(self, min_connections, max_connections, wait_seconds, healthcheck_idle_seconds, **connect_kwargs):
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.wait_seconds = wait_seconds
+        self.healthcheck_idle_seconds = healthcheck_idle_seconds
+        self.connect_kwargs = connect_kwargs
+
+        self.pool = None
+        self.pid = None
+        self.slots = None
+        # Created on first use, after eventlet.monkey_patch(), so waiting on it parks a greenlet
+        self.init_lock = None
+        self.last_used = {}  # id(connection) -> monotonic time it was returned
+
+        self.wait_latency = LatencyStats()
+        self.checkouts = 0
+        self.in_use = 0
+        self.timeouts = 0
+        self.healthcheck_failures = 0
+
+    def _ensure_pool(self):
+        if self.pool is not None and self.pid == os.getpid():
+            return self.pool
+        if self.init_lock is None or self.pid != os.getpid():
+            self.init_lock = threading.Lock()
+            self.pid = os.getpid()
+            self.pool = None
+        created = False
+        with self.init_lock:
+            if self.pool is None:
+                # No connections are opened here, connecting yields to the hub and must not hold the lock
+                self.pool = ThreadedConnectionPool(0, self.max_connections, **self.connect_kwargs)
+                # Waiting happens on the semaphore, ThreadedConnectionPool itself raises when exhausted
+                self.slots = threading.BoundedSemaphore(self.max_connections)
+                self.last_used = {}
+                self.in_use = 0
+                created = True
+        if created:
+            self._warm_up()
+        return self.pool
+
+    def _warm_up(self):
+        """Open min_connections outside any lock, a failure only means connecting on demand later"""
+        connections = []
+        try:
+            for _ in range(self.min_connections):
+                connections.append(self.getconn())
+        except Exception as e:
+            logging.error(f"Error opening the initial database connections: {e}")
+        finally:
+            for connection in connections:
+                self.putconn(connection)
+        logging.info(f"Database pool opened with {self.min_connections}-{self.max_connections} connections")
+
+    def _healthy(self, connection):
+        if connection.closed:
+            return False
+        last_used = self.last_used.get(id(connection))
+        if last_used is None or time.monotonic() - last_used < self.healthcheck_idle_seconds:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        pool = self._ensure_pool()
+        started = time.perf_counter()
+        if not self.slots.acquire(timeout=self.wait_seconds):
+            self.timeouts += 1
+            logging.error(f"Timed out after {self.wait_seconds}s waiting for one of {self.max_connections} connections")
+            raise PoolTimeout("Database is busy, retry shortly")
+        self.wait_latency.record("checkout", (time.perf_counter() - started) * 1000)
+
+        try:
+            connection = pool.getconn()
+            if not self._healthy(connection):
+                self.healthcheck_failures += 1
+                logging.info("Replacing a dropped database connection")
+                self.last_used.pop(id(connection), None)
+                pool.putconn(connection, close=True)
+                connection = pool.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+        self.checkouts += 1
+        self.in_use += 1
+        return connection
+
+    def putconn(self, connection):
+        try:
+            broken = bool(connection.closed)
+            if not broken and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    connection.rollback()
+                except psycopg2.Error:
+                    broken = True
+            if broken:
+                self.last_used.pop(id(connection), None)
+            else:
+                self.last_used[id(connection)] = time.monotonic()
+            self.pool.putconn(connection, close=broken)
+        finally:
+            self.in_use -= 1
+            self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the block, or the current request's connection inside one"""
+        if not has_app_context():
+            connection = self.getconn()
+            try:
+                yield connection
+            finally:
+                self.putconn(connection)
+            return
+
+        connection = g.get("db_connection")
+        if connection is None:
+            connection = g.db_connection = self.getconn()
+        try:
+            yield connection
+        except Exception:
+            # A failed block must not leave an aborted transaction for the next one
+            if not connection.closed:
+                try:
+                    connection.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+
+    def release_request_connection(self, exception=None):
+        """App context teardown: give the request's connection back, rolling back anything uncommitted"""
+        connection = g.pop("db_connection", None)
+        if connection is not None:
+            self.putconn(connection)
+
+    @contextmanager
+    def cursor(self):
+        """DictCursor on a borrowed connection; commit with cursor.connection.commit()"""
+        with self.connection() as connection:
+            with connection.cursor(cursor_factory=DictCursor) as cursor:
+                yield cursor
+
+    def stats(self):
+        return {
+            "min_connections": self.min_connections,
+            "max_connections": self.max_connections,
+            "in_use": self.in_use,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "healthcheck_failures": self.healthcheck_failures,
+            "wait": self.wait_latency.snapshot()
+        }
+
+
+db_pool = DatabasePool(
+    DB_POOL_MIN_CONNECTIONS,
+    DB_POOL_MAX_CONNECTIONS,
+    DB_POOL_WAIT_SECONDS,
+    DB_POOL_HEALTHCHECK_IDLE_SECONDS,
+    host=POSTGRES_HOST,
+    database=POSTGRES_DB,
+    user=POSTGRES_USER,
+    password=POSTGRES_PASSWORD,
+    port=POSTGRES_PORT
+)
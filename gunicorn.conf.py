@@ -1,5 +1,37 @@
 import os
+import sys
 import multiprocessing
+import subprocess
+from config.config import EMBEDDING_BACKEND, EMBEDDING_SERVICE_SOCKET, SWIPE_QUOTA_BACKEND
 
 workers = multiprocessing.cpu_count() * 2 + 1
+
+# In-process swipe quotas only see their own worker's swipes
+if SWIPE_QUOTA_BACKEND == "memory" and workers > 1:
+    raise RuntimeError("SWIPE_QUOTA_BACKEND=memory needs a single worker, use redis or database")
 timeout = 120
+
+embedding_service = None
+
+
+def on_starting(server):
+    # One embedding service per host instead of one model copy per worker
+    global embedding_service
+    if EMBEDDING_SERVICE_SOCKET and EMBEDDING_BACKEND == "huggingface":
+        embedding_service = subprocess.Popen(
+            [sys.executable, "-m", "model.embedding_service", "--socket", EMBEDDING_SERVICE_SOCKET]
+        )
+        server.log.info(f"Started embedding service (pid {embedding_service.pid}) on {EMBEDDING_SERVICE_SOCKET}")
+
+
+def on_exit(server):
+    if embedding_service and embedding_service.poll() is None:
+        embedding_service.terminate()
+        embedding_service.wait(timeout=10)
+
+
+def worker_exit(server, worker):
+    # Left swipes acknowledged but still buffered in this worker are written before it exits
+    from model.swipe_model import left_swipe_writer
+    if not left_swipe_writer.flush():
+        server.log.error("Could not write every buffered left swipe, see the application log")
@@ -0,0 +1,130 @@
+"""
+Keep the weekly swipe_logs partitions ahead of time and retire old ones.
+
+Creates partitions for the coming weeks, then for every partition that ended more than
+the retention period ago folds its swipes into swipe_history (last direction per pair)
+and drops it, both in one transaction so deduplication never misses a swipe. The
+retention must stay longer than the quota window and the 7 day reciprocal swipe check.
+Swipes that landed in the default partition because their week had no partition yet
+(database/migrations/011) are moved into the week's partition when it is created.
+
+Run daily from cron:
+    python -m jobs.maintain_swipe_logs
+    python -m jobs.maintain_swipe_logs --retention-days 35 --weeks-ahead 4 --keep-detached
+"""
+import sys
+import time
+import argparse
+from datetime import date, datetime, timedelta
+from config.config import SWIPE_LOG_RETENTION_DAYS, SWIPE_LOG_PARTITIONS_AHEAD_WEEKS, SWIPE_QUOTA_WINDOW_SECONDS
+from database.pool import db_pool
+from utils.exception import CustomException
+from utils.logger import logging
+
+PARTITION_PREFIX = "swipe_logs_"
+DEFAULT_PARTITION = "swipe_logs_default"
+
+
+def create_partitions(weeks_ahead):
+    """
+    Partitions from this week through weeks_ahead weeks from now, plus any earlier week with
+    swipes waiting in the default partition, returns how many were new
+    """
+    with db_pool.cursor() as cursor:
+        today = date.today()
+        cursor.execute(f'SELECT MIN(swiped_at)::DATE AS oldest, COUNT(*) AS waiting FROM "{DEFAULT_PARTITION}";')
+        row = cursor.fetchone()
+        if row['waiting']:
+            logging.warning(
+                f"{row['waiting']} swipes since {row['oldest']} are in {DEFAULT_PARTITION}, "
+                f"moving them into weekly partitions"
+            )
+        start = min(today, row['oldest']) if row['oldest'] else today
+        cursor.execute(
+            "SELECT create_swipe_log_partitions(%s, %s) AS created;",
+            (start, today + timedelta(weeks=weeks_ahead + 1))
+        )
+        created = cursor.fetchone()['created']
+        cursor.connection.commit()
+    return created
+
+
+def expired_partitions(cutoff):
+    """Names of partitions whose whole week lies before cutoff, oldest first"""
+    with db_pool.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'swipe_logs'::regclass
+            ORDER BY c.relname;
+        """)
+        names = [row['relname'] for row in cursor.fetchall()]
+    expired = []
+    for name in names:
+        if name == DEFAULT_PARTITION:
+            continue
+        week_start = datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+        if week_start + timedelta(days=7) <= cutoff:
+            expired.append(name)
+    return expired
+
+
+def retire_partition(name, keep_detached=False):
+    """Roll the partition's swipes up into swipe_history, then detach and drop it"""
+    with db_pool.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO swipe_history (user_id, target_user_id, last_direction, last_swiped_at)
+            SELECT DISTINCT ON (user_id, target_user_id)
+                   user_id, target_user_id, swipe_direction, swiped_at
+            FROM "{name}"
+            ORDER BY user_id, target_user_id, swiped_at DESC, swipe_id DESC
+            ON CONFLICT (user_id, target_user_id) DO UPDATE
+            SET last_direction = EXCLUDED.last_direction, last_swiped_at = EXCLUDED.last_swiped_at
+            WHERE swipe_history.last_swiped_at <= EXCLUDED.last_swiped_at;
+        """)
+        rolled_up = cursor.rowcount
+        cursor.execute(f'ALTER TABLE swipe_logs DETACH PARTITION "{name}";')
+        if not keep_detached:
+            cursor.execute(f'DROP TABLE "{name}";')
+        cursor.connection.commit()
+    return rolled_up
+
+
+def run(retention_days, weeks_ahead, keep_detached=False):
+    # The hot paths must still find every swipe they look for in the live partitions
+    minimum_days = max(7, SWIPE_QUOTA_WINDOW_SECONDS / 86400) + 7
+    if retention_days < minimum_days:
+        raise ValueError(f"retention_days must be at least {minimum_days:g}")
+
+    try:
+        started = time.monotonic()
+        created = create_partitions(weeks_ahead)
+        retired = 0
+        for name in expired_partitions(date.today() - timedelta(days=retention_days)):
+            rolled_up = retire_partition(name, keep_detached)
+            retired += 1
+            logging.info(f"Retired {name}, {rolled_up} swipe_history rows written")
+        logging.info(
+            f"Swipe log maintenance created {created} and retired {retired} partitions "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+        return created, retired
+    except Exception as e:
+        logging.error(f"Error maintaining swipe_logs partitions: {e}")
+        raise CustomException(e, sys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create upcoming swipe_logs partitions and retire old ones")
+    parser.add_argument("--retention-days", type=int, default=SWIPE_LOG_RETENTION_DAYS)
+    parser.add_argument("--weeks-ahead", type=int, default=SWIPE_LOG_PARTITIONS_AHEAD_WEEKS)
+    parser.add_argument("--keep-detached", action="store_true", help="detach retired partitions instead of dropping them")
+    args = parser.parse_args()
+
+    created, retired = run(args.retention_days, args.weeks_ahead, args.keep_detached)
+    print(f"Created {created} and retired {retired} swipe_logs partitions")
+
+
+if __name__ == "__main__":
+    main()
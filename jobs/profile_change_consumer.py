@@ -0,0 +1,84 @@
+"""
+Keep the vector index in step with profile edits.
+
+Drains profile_change_outbox in batches, re-embedding only the users whose location or
+interests changed and appending them to the index change log that the web workers replay.
+Wakes up on the profile_changes notification sent with every outbox row, and polls as a
+fallback, so changes are indexed within seconds. Safe to run next to the web workers or as several
+copies, outbox rows are claimed with SKIP LOCKED and index writes take turns on its lock file.
+
+    python -m jobs.profile_change_consumer --batch-size 64 --poll-seconds 5
+    python -m jobs.profile_change_consumer --once   # drain the backlog and exit, for cron
+"""
+import sys
+import time
+import select
+import argparse
+import psycopg2
+from config.config import *
+from model.recommendation_model import RecommendationModel
+from utils.exception import CustomException
+from utils.logger import logging
+
+
+def listen(channel):
+    connection = psycopg2.connect(
+        host=POSTGRES_HOST,
+        database=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        port=POSTGRES_PORT
+    )
+    connection.autocommit = True
+    connection.cursor().execute(f"LISTEN {channel};")
+    return connection
+
+
+def drain(model, batch_size):
+    """Process outbox batches until it is empty, returns the number of rows handled"""
+    total = 0
+    while True:
+        drained = model.drain_profile_changes(batch_size)
+        total += drained
+        if drained < batch_size:
+            return total
+
+
+def run(batch_size, poll_seconds, once=False):
+    model = RecommendationModel()
+    listener = None if once else listen("profile_changes")
+    try:
+        while True:
+            started = time.monotonic()
+            drained = drain(model, batch_size)
+            if drained:
+                logging.info(f"Indexed {drained} profile changes in {time.monotonic() - started:.2f}s")
+            if once:
+                return drained
+
+            # Sleep until a profile write notifies us or the poll interval passes
+            if select.select([listener], [], [], poll_seconds)[0]:
+                listener.poll()
+                listener.notifies.clear()
+    except Exception as e:
+        logging.error(f"Error in profile change consumer: {e}")
+        raise CustomException(e, sys)
+    finally:
+        if listener is not None:
+            listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed users whose profiles changed")
+    parser.add_argument("--batch-size", type=int, default=PROFILE_EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--poll-seconds", type=float, default=5.0)
+    parser.add_argument("--once", action="store_true", help="drain the outbox once and exit")
+    args = parser.parse_args()
+
+    drained = run(args.batch_size, args.poll_seconds, args.once)
+    if args.once:
+        print(f"Indexed {drained} profile changes")
+
+
+if __name__ == "__main__":
+    main()
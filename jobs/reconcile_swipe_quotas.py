@@ -0,0 +1,45 @@
+"""
+Rebuild the shared swipe quota windows from swipe_logs.
+
+Every user who swiped inside the quota window gets their Redis window replaced with the
+swipes the table actually holds, correcting drift from lost confirms, failed releases or
+rows deleted by hand. Swipes still being recorded keep their reserved slot. Only useful
+with REDIS_URL set, in-process windows belong to the web workers.
+
+Run from cron:
+    python -m jobs.reconcile_swipe_quotas
+"""
+import sys
+import time
+import argparse
+from config.config import REDIS_URL, SWIPE_QUOTA_WINDOW_SECONDS
+from model.swipe_quota import swipe_quota, load_recent_swipes
+from utils.exception import CustomException
+from utils.logger import logging
+
+
+def reconcile(window_seconds):
+    """Returns the number of user windows rebuilt"""
+    try:
+        started = time.monotonic()
+        reconciled = swipe_quota.reconcile(load_recent_swipes(window_seconds))
+        logging.info(f"Reconciled {reconciled} swipe quota windows in {time.monotonic() - started:.2f}s")
+        return reconciled
+    except Exception as e:
+        logging.error(f"Error reconciling swipe quotas: {e}")
+        raise CustomException(e, sys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild swipe quota windows from swipe_logs")
+    parser.add_argument("--window-seconds", type=int, default=SWIPE_QUOTA_WINDOW_SECONDS)
+    args = parser.parse_args()
+
+    if not REDIS_URL:
+        print("REDIS_URL is not set, swipe quotas live inside each web worker")
+        return
+    print(f"Reconciled {reconcile(args.window_seconds)} swipe quota windows")
+
+
+if __name__ == "__main__":
+    main()
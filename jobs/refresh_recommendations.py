@@ -0,0 +1,174 @@
+"""
+Recompute user_recommendation_entries for every user at once.
+
+Loads every profile embedding into one matrix, scores all users against each other in
+row blocks with a single matrix multiply per block, masks out the pairs each block's
+users already swiped on or matched with, keeps the top-k per user with argpartition,
+and rewrites the whole table with COPY inside one transaction. When no profile loads
+the stored lists are left as they are.
+
+Run from cron:
+    python -m jobs.refresh_recommendations --top-k 50 --block-size 1024
+"""
+import io
+import sys
+import time
+import argparse
+import numpy as np
+from model.recommendation_model import RecommendationModel
+from model.recommendation_cache import recommendation_cache
+from database.pool import db_pool
+from utils.exception import CustomException
+from utils.logger import logging
+
+
+def load_profile_matrix(model):
+    """User ids and L2-normalised embeddings of every complete profile"""
+    with db_pool.cursor() as cursor:
+        cursor.execute("""
+            SELECT up.user_id, up.location, up.interest
+            FROM user_profile up
+            WHERE up.location IS NOT NULL AND up.interest IS NOT NULL
+            ORDER BY up.user_id;
+        """)
+        profiles = cursor.fetchall()
+    if not profiles:
+        return np.empty(0, dtype="int64"), None
+    user_ids = np.asarray([profile['user_id'] for profile in profiles], dtype="int64")
+    texts = [model.profile_text(profile['location'], profile['interest']) for profile in profiles]
+
+    matrix = model.embed_model.embed_documents(texts)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.maximum(norms, 1e-12)
+    return user_ids, matrix
+
+
+def load_excluded_pairs(user_ids, start, stop):
+    """
+    (block_rows, columns) of the pairs the users in rows [start, stop) swiped on, in
+    swipe_logs or swipe_history, or are matched with. user_ids is sorted, pairs with users
+    outside the matrix are dropped.
+    """
+    block_ids = user_ids[start:stop].tolist()
+    with db_pool.cursor() as cursor:
+        cursor.execute("""
+            SELECT user_id, target_user_id FROM swipe_logs WHERE user_id = ANY(%s)
+            UNION
+            SELECT user_id, target_user_id FROM swipe_history WHERE user_id = ANY(%s)
+            UNION
+            SELECT user1_id, user2_id FROM matches WHERE user1_id = ANY(%s)
+            UNION
+            SELECT user2_id, user1_id FROM matches WHERE user2_id = ANY(%s);
+        """, (block_ids, block_ids, block_ids, block_ids))
+        pairs = np.asarray(
+            [(row['user_id'], row['target_user_id']) for row in cursor.fetchall()], dtype="int64"
+        ).reshape(-1, 2)
+
+    rows = np.searchsorted(user_ids, pairs[:, 0])
+    columns = np.minimum(np.searchsorted(user_ids, pairs[:, 1]), len(user_ids) - 1)
+    known = user_ids[columns] == pairs[:, 1]
+    return rows[known] - start, columns[known]
+
+
+def blocked_top_k(matrix, top_k, block_size, excluded_pairs=None):
+    """
+    Yield (row_offset, neighbour_rows, cosine_scores) for each block of rows.
+    Only a block_size x N similarity block is ever held in memory. excluded_pairs(start, stop)
+    returns (block_rows, columns) never to recommend, they come back with a score of -inf
+    only when a user has fewer than top_k other candidates.
+    """
+    total = matrix.shape[0]
+    k = min(top_k, total - 1)
+    if k <= 0:
+        return
+    for start in range(0, total, block_size):
+        block = matrix[start:start + block_size]
+        scores = block @ matrix.T
+        # A user is never their own recommendation
+        rows = np.arange(block.shape[0])
+        scores[rows, start + rows] = -np.inf
+        if excluded_pairs is not None:
+            scores[excluded_pairs(start, start + block.shape[0])] = -np.inf
+
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        yield (
+            start,
+            np.take_along_axis(candidates, order, axis=1),
+            np.take_along_axis(candidate_scores, order, axis=1)
+        )
+
+
+def write_recommendations(user_ids, blocks):
+    """Replace user_recommendation_entries in one transaction, one COPY per block"""
+    rows_written = 0
+    try:
+        with db_pool.cursor() as cursor:
+            # Readers keep seeing the previous lists until the commit
+            cursor.execute("DELETE FROM user_recommendation_entries;")
+            for start, neighbours, scores in blocks:
+                count, k = neighbours.shape
+                # Excluded pairs only reach the top-k of users with too few other candidates
+                kept = np.isfinite(scores).ravel()
+                columns = np.column_stack([
+                    np.repeat(user_ids[start:start + count], k),
+                    user_ids[neighbours].ravel(),
+                    # Same scale as the live path: 1 - squared L2 distance of unit vectors
+                    np.round(2 * scores.ravel() - 1, 3),
+                    np.tile(np.arange(1, k + 1), count)
+                ])[kept]
+                buffer = io.StringIO()
+                np.savetxt(buffer, columns, fmt=["%d", "%d", "%.3f", "%d"], delimiter="\t")
+                rows_written += columns.shape[0]
+                buffer.seek(0)
+                cursor.copy_expert(
+                    "COPY user_recommendation_entries (user_id, recommended_user_id, similarity_score, rank) FROM STDIN",
+                    buffer
+                )
+            cursor.connection.commit()
+        # Reaches every worker with the Redis backend, local caches expire on their own TTL
+        recommendation_cache.invalidate(*user_ids.tolist())
+        return rows_written
+    except Exception as e:
+        logging.error(f"Error writing batch recommendations: {e}")
+        raise CustomException(e, sys)
+
+
+def run(top_k, block_size):
+    started = time.monotonic()
+    model = RecommendationModel()
+    user_ids, matrix = load_profile_matrix(model)
+    loaded = time.monotonic()
+    logging.info(f"Loaded {len(user_ids)} profile embeddings in {loaded - started:.1f}s")
+    if not len(user_ids):
+        # An empty or unreachable profile table must not wipe every stored list
+        logging.warning("No profiles loaded, keeping the stored recommendations")
+        return 0, 0, loaded - started
+
+    blocks = blocked_top_k(
+        matrix, top_k, block_size,
+        excluded_pairs=lambda start, stop: load_excluded_pairs(user_ids, start, stop)
+    )
+    rows_written = write_recommendations(user_ids, blocks)
+    finished = time.monotonic()
+    logging.info(
+        f"Stored {rows_written} recommendations for {len(user_ids)} users "
+        f"in {finished - loaded:.1f}s, cache stats: {model.embedding_cache_stats()}"
+    )
+    return len(user_ids), rows_written, finished - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute recommendations for every user")
+    parser.add_argument("--top-k", type=int, default=RecommendationModel.DEFAULT_RECOMMENDATION_LIMIT)
+    parser.add_argument("--block-size", type=int, default=1024,
+                        help="rows scored per matrix multiply, bounds memory to block_size x users floats")
+    args = parser.parse_args()
+
+    users, rows, elapsed = run(args.top_k, args.block_size)
+    print(f"Refreshed recommendations for {users} users ({rows} rows) in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
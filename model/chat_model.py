@@ -1,121 +1,150 @@
-import psycopg2
-from psycopg2.extras import DictCursor
 import sys
 from config.config import *
 from utils.exception import CustomException
 from utils.logger import logging
+from database.pool import db_pool
 from datetime import datetime
 
 class ChatModel:
-    def __init__(self):
-        try:
-            self.connection = psycopg2.connect(
-                host=POSTGRES_HOST,
-                database=POSTGRES_DB,
-                user=POSTGRES_USER,
-                password=POSTGRES_PASSWORD,
-                port=POSTGRES_PORT
-            )
-            self.cursor = self.connection.cursor(cursor_factory=DictCursor)
-        except Exception as e:
-            logging.error(f"Error connecting to database: {e}")
-            raise CustomException(e, sys)
-
     def send_message(self, sender_id, receiver_id, message_text):
         """Send a message to another user if they are matched"""
         try:
-            # First check if users are matched
-            match_check_query = """
-                SELECT match_id FROM matches 
-                WHERE ((user1_id = %s AND user2_id = %s) 
-                    OR (user1_id = %s AND user2_id = %s))
-                AND is_active = TRUE;
-            """
-            self.cursor.execute(match_check_query, (sender_id, receiver_id, receiver_id, sender_id))
-            match = self.cursor.fetchone()
+            with db_pool.cursor() as cursor:
+                # First check if users are matched
+                match_check_query = """
+                    SELECT match_id FROM matches 
+                    WHERE ((user1_id = %s AND user2_id = %s) 
+                        OR (user1_id = %s AND user2_id = %s))
+                    AND is_active = TRUE;
+                """
+                cursor.execute(match_check_query, (sender_id, receiver_id, receiver_id, sender_id))
+                match = cursor.fetchone()
             
-            if not match:
-                return {"status": "error", "message": "Users are not matched"}
+                if not match:
+                    return {"status": "error", "message": "Users are not matched"}
                 
-            # If matched, insert the message
-            message_query = """
-                INSERT INTO messages (sender_id, receiver_id, message_text, status)
-                VALUES (%s, %s, %s, 'sent') 
-                RETURNING message_id, sent_at;
-            """
+                # If matched, insert the message
+                message_query = """
+                    INSERT INTO messages (sender_id, receiver_id, message_text, status)
+                    VALUES (%s, %s, %s, 'sent') 
+                    RETURNING message_id, sent_at;
+                """
             
-            self.cursor.execute(message_query, (sender_id, receiver_id, message_text))
-            result = self.cursor.fetchone()
-            self.connection.commit()
+                cursor.execute(message_query, (sender_id, receiver_id, message_text))
+                result = cursor.fetchone()
+                cursor.connection.commit()
             
-            return {
-                "status": "success", 
-                "message": "Message sent",
-                "data": {
-                    "message_id": result['message_id'],
-                    "sent_at": result['sent_at'].isoformat()
+                return {
+                    "status": "success", 
+                    "message": "Message sent",
+                    "data": {
+                        "message_id": result['message_id'],
+                        "sent_at": result['sent_at'].isoformat()
+                    }
                 }
-            }
             
         except Exception as e:
-            self.connection.rollback()
             logging.error(f"Error sending message: {e}")
             return {"status": "error", "message": str(e)}
     
-    def get_chat_history(self, user_id, other_user_id):
-        """Get chat history between two users"""
+    def get_chat_history(self, user_id, other_user_id, before=None, after=None, limit=CHAT_HISTORY_PAGE_SIZE):
+        """
+        One page of the conversation, oldest first. Without a cursor it is the latest `limit`
+        messages; before=<message_id> pages back through older ones and after=<message_id>
+        returns only what arrived since, for reconnecting clients. Pages seek on the
+        (conversation, sent_at, message_id) index, so they cost the same at any length.
+        A cursor that is not a message of this conversation is an error, not an empty page.
+        """
         try:
-            # First check if users are matched
-            match_check_query = """
-                SELECT match_id FROM matches 
-                WHERE ((user1_id = %s AND user2_id = %s) 
-                    OR (user1_id = %s AND user2_id = %s))
-                AND is_active = TRUE;
-            """
-            self.cursor.execute(match_check_query, (user_id, other_user_id, other_user_id, user_id))
-            match = self.cursor.fetchone()
+            with db_pool.cursor() as cursor:
+                # Match check and both usernames in one lookup on unique_match
+                match_check_query = """
+                    SELECT m.match_id, u1.username AS user1_username, u2.username AS user2_username
+                    FROM matches m
+                    JOIN user_db u1 ON u1.id = m.user1_id
+                    JOIN user_db u2 ON u2.id = m.user2_id
+                    WHERE m.user1_id = %s AND m.user2_id = %s
+                    AND m.is_active = TRUE;
+                """
+                user1_id, user2_id = sorted([user_id, other_user_id])
+                cursor.execute(match_check_query, (user1_id, user2_id))
+                match = cursor.fetchone()
             
-            if not match:
-                return {"status": "error", "message": "Users are not matched"}
+                if not match:
+                    return {"status": "error", "message": "Users are not matched"}
 
-            # Get messages between the users
-            query = """
-                SELECT m.message_id, m.sender_id, m.receiver_id, m.message_text, 
-                       m.sent_at, m.status,
-                       s.username as sender_username,
-                       r.username as receiver_username
-                FROM messages m
-                JOIN user_db s ON m.sender_id = s.id
-                JOIN user_db r ON m.receiver_id = r.id
-                WHERE (m.sender_id = %s AND m.receiver_id = %s)
-                   OR (m.sender_id = %s AND m.receiver_id = %s)
-                ORDER BY m.sent_at ASC;
-            """
-            self.cursor.execute(query, (user_id, other_user_id, other_user_id, user_id))
-            messages = self.cursor.fetchall()
+                # Newer pages read forwards from the cursor, the latest and older pages read backwards
+                forwards = after is not None
+                cursor_id = after if forwards else before
+                keyset = ""
+                if cursor_id is not None:
+                    keyset = f"""
+                    AND (m.sent_at, m.message_id) {'>' if forwards else '<'} (
+                        SELECT c.sent_at, c.message_id
+                        FROM messages c
+                        WHERE c.message_id = %s
+                        AND LEAST(c.sender_id, c.receiver_id) = %s
+                        AND GREATEST(c.sender_id, c.receiver_id) = %s
+                    )"""
+                order = "ASC" if forwards else "DESC"
+                query = f"""
+                    SELECT m.message_id, m.sender_id, m.receiver_id, m.message_text,
+                           m.sent_at, m.status
+                    FROM messages m
+                    WHERE LEAST(m.sender_id, m.receiver_id) = %s
+                    AND GREATEST(m.sender_id, m.receiver_id) = %s {keyset}
+                    ORDER BY m.sent_at {order}, m.message_id {order}
+                    LIMIT %s;
+                """
+                params = (user1_id, user2_id)
+                if cursor_id is not None:
+                    params += (cursor_id, user1_id, user2_id)
+                # One extra row tells whether another page exists
+                cursor.execute(query, params + (limit + 1,))
+                messages = cursor.fetchall()
+                # The keyset only matches rows when the cursor is a message of this conversation
+                if not messages and cursor_id is not None:
+                    cursor.execute("""
+                        SELECT 1 FROM messages
+                        WHERE message_id = %s
+                        AND LEAST(sender_id, receiver_id) = %s
+                        AND GREATEST(sender_id, receiver_id) = %s;
+                    """, (cursor_id, user1_id, user2_id))
+                    if not cursor.fetchone():
+                        return {"status": "error", "message": "Invalid cursor, no such message in this conversation"}
+                has_more = len(messages) > limit
+                messages = messages[:limit]
+                if not forwards:
+                    messages.reverse()
             
-            # Update status to 'read' for received messages
-            update_query = """
-                UPDATE messages 
-                SET status = 'read'
-                WHERE receiver_id = %s AND sender_id = %s AND status != 'read';
-            """
-            self.cursor.execute(update_query, (user_id, other_user_id))
-            self.connection.commit()
+                # Mark received messages read only up to the newest one this page delivers
+                if messages:
+                    newest = messages[-1]
+                    update_query = """
+                        UPDATE messages 
+                        SET status = 'read'
+                        WHERE receiver_id = %s AND sender_id = %s AND status != 'read'
+                        AND (sent_at, message_id) <= (%s, %s);
+                    """
+                    cursor.execute(update_query, (user_id, other_user_id, newest['sent_at'], newest['message_id']))
+                    cursor.connection.commit()
             
-            return {
-                "status": "success", 
-                "data": [{
-                    "message_id": msg['message_id'],
-                    "sender_id": msg['sender_id'],
-                    "receiver_id": msg['receiver_id'],
-                    "message_text": msg['message_text'],
-                    "sent_at": msg['sent_at'].isoformat(),
-                    "status": msg['status'],
-                    "sender_username": msg['sender_username'],
-                    "receiver_username": msg['receiver_username']
-                } for msg in messages]
-            }
+                return {
+                    "status": "success", 
+                    "data": [{
+                        "message_id": msg['message_id'],
+                        "sender_id": msg['sender_id'],
+                        "receiver_id": msg['receiver_id'],
+                        "message_text": msg['message_text'],
+                        "sent_at": msg['sent_at'].isoformat(),
+                        "status": msg['status']
+                    } for msg in messages],
+                    "usernames": {
+                        str(user1_id): match['user1_username'],
+                        str(user2_id): match['user2_username']
+                    },
+                    "has_more": has_more
+                }
             
         except Exception as e:
             logging.error(f"Error getting chat history: {e}")
@@ -124,47 +153,48 @@ class ChatModel:
     def get_recent_chats(self, user_id):
         """Get list of recent chats for a user"""
         try:
-            query = """
-                WITH LastMessages AS (
-                    SELECT DISTINCT ON (
+            with db_pool.cursor() as cursor:
+                query = """
+                    WITH LastMessages AS (
+                        SELECT DISTINCT ON (
+                            CASE 
+                                WHEN sender_id = %s THEN receiver_id 
+                                ELSE sender_id 
+                            END
+                        )
+                        m.message_id, m.sender_id, m.receiver_id, m.message_text, 
+                        m.sent_at, m.status,
                         CASE 
                             WHEN sender_id = %s THEN receiver_id 
                             ELSE sender_id 
-                        END
+                        END as other_user_id
+                        FROM messages m
+                        WHERE sender_id = %s OR receiver_id = %s
+                        ORDER BY other_user_id, sent_at DESC
                     )
-                    m.message_id, m.sender_id, m.receiver_id, m.message_text, 
-                    m.sent_at, m.status,
-                    CASE 
-                        WHEN sender_id = %s THEN receiver_id 
-                        ELSE sender_id 
-                    END as other_user_id
-                    FROM messages m
-                    WHERE sender_id = %s OR receiver_id = %s
-                    ORDER BY other_user_id, sent_at DESC
-                )
-                SELECT 
-                    lm.*,
-                    u.username as other_username,
-                    u.email as other_email
-                FROM LastMessages lm
-                JOIN user_db u ON u.id = lm.other_user_id
-                ORDER BY lm.sent_at DESC;
-            """
-            self.cursor.execute(query, (user_id, user_id, user_id, user_id))
-            chats = self.cursor.fetchall()
+                    SELECT 
+                        lm.*,
+                        u.username as other_username,
+                        u.email as other_email
+                    FROM LastMessages lm
+                    JOIN user_db u ON u.id = lm.other_user_id
+                    ORDER BY lm.sent_at DESC;
+                """
+                cursor.execute(query, (user_id, user_id, user_id, user_id))
+                chats = cursor.fetchall()
             
-            return {
-                "status": "success",
-                "data": [{
-                    "message_id": chat['message_id'],
-                    "other_user_id": chat['other_user_id'],
-                    "other_username": chat['other_username'],
-                    "other_email": chat['other_email'],
-                    "last_message": chat['message_text'],
-                    "sent_at": chat['sent_at'].isoformat(),
-                    "status": chat['status']
-                } for chat in chats]
-            }
+                return {
+                    "status": "success",
+                    "data": [{
+                        "message_id": chat['message_id'],
+                        "other_user_id": chat['other_user_id'],
+                        "other_username": chat['other_username'],
+                        "other_email": chat['other_email'],
+                        "last_message": chat['message_text'],
+                        "sent_at": chat['sent_at'].isoformat(),
+                        "status": chat['status']
+                    } for chat in chats]
+                }
             
         except Exception as e:
             logging.error(f"Error getting recent chats: {e}")
@@ -173,21 +203,21 @@ class ChatModel:
     def delete_message(self, message_id, user_id):
         """Delete a message (soft delete)"""
         try:
-            query = """
-                UPDATE messages 
-                SET is_deleted = TRUE
-                WHERE message_id = %s AND (sender_id = %s OR receiver_id = %s)
-                RETURNING message_id;
-            """
-            self.cursor.execute(query, (message_id, user_id, user_id))
-            result = self.cursor.fetchone()
-            self.connection.commit()
+            with db_pool.cursor() as cursor:
+                query = """
+                    UPDATE messages 
+                    SET is_deleted = TRUE
+                    WHERE message_id = %s AND (sender_id = %s OR receiver_id = %s)
+                    RETURNING message_id;
+                """
+                cursor.execute(query, (message_id, user_id, user_id))
+                result = cursor.fetchone()
+                cursor.connection.commit()
             
-            if result:
-                return {"status": "success", "message": "Message deleted"}
-            return {"status": "error", "message": "Message not found or unauthorized"}
+                if result:
+                    return {"status": "success", "message": "Message deleted"}
+                return {"status": "error", "message": "Message not found or unauthorized"}
             
         except Exception as e:
-            self.connection.rollback()
             logging.error(f"Error deleting message: {e}")
             return {"status": "error", "message": str(e)}
@@ -0,0 +1,96 @@
+"""
+Embedding backends for profile texts.
+
+Every backend exposes embed_documents(texts) and embed_query(text) like the LangChain
+embedding classes, so EmbeddingCache and RecommendationModel never care which one runs.
+
+    huggingface  sentence-transformers model (EMBEDDING_MODEL_NAME), needs torch and the weights
+    hashed       feature-hashed bag of words and character n-grams in NumPy, no model to load
+"""
+import re
+import math
+import zlib
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+
+# Words every profile text shares, see RecommendationModel.profile_text
+PROFILE_TEMPLATE_WORDS = frozenset({"user", "has", "city", "and", "love"})
+
+
+class HashedEmbeddings:
+    """
+    Dependency-light embedder for small deployments. Each word of the profile text and its
+    character n-grams are hashed into `dimension` signed buckets (the hashing trick), word
+    counts are damped with 1 + log(tf) and rows are L2-normalized. Vectors only depend on
+    the text itself, so they stay valid in the content-addressed embedding cache.
+    """
+
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+    def __init__(self, dimension=512, ngram_size=3, ngram_weight=0.5):
+        self.dimension = dimension
+        self.ngram_size = ngram_size
+        self.ngram_weight = ngram_weight
+        # Profiles reuse a small city and interest vocabulary, hash each word once
+        self._word_features = lru_cache(maxsize=65536)(self._compute_word_features)
+
+    @property
+    def model_id(self):
+        """Identifies the vector space, used in embedding cache keys"""
+        return f"hashed-v1-{self.dimension}-{self.ngram_size}-{self.ngram_weight}"
+
+    def _bucket(self, feature):
+        digest = zlib.crc32(feature.encode("utf-8"))
+        return digest % self.dimension, (1.0 if digest & 0x80000000 else -1.0)
+
+    def _compute_word_features(self, word):
+        """(buckets, signed weights) of one word: the word itself plus its character n-grams"""
+        features = [self._bucket(f"w:{word}") + (1.0,)]
+        padded = f"#{word}#"
+        ngrams = [padded[i:i + self.ngram_size] for i in range(len(padded) - self.ngram_size + 1)]
+        for ngram in ngrams:
+            # The n-grams of a word share one word's worth of weight
+            features.append(self._bucket(f"g:{ngram}") + (self.ngram_weight / len(ngrams),))
+        buckets = np.fromiter((bucket for bucket, _, _ in features), dtype=np.int64, count=len(features))
+        weights = np.fromiter((sign * weight for _, sign, weight in features), dtype=np.float32, count=len(features))
+        return buckets, weights
+
+    def tokens(self, text):
+        return [
+            word for word in self.TOKEN_PATTERN.findall(str(text).lower())
+            if word not in PROFILE_TEMPLATE_WORDS
+        ]
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word, count in Counter(self.tokens(text)).items():
+                buckets, weights = self._word_features(word)
+                np.add.at(vectors[row], buckets, weights * (1.0 + math.log(count)))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+EMBEDDING_BACKENDS = ("huggingface", "hashed")
+
+
+def create_embedder(backend, model_name=None, dimension=512):
+    """Embedding model for the configured backend; imports torch only for huggingface"""
+    if backend == "huggingface":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name)
+    if backend == "hashed":
+        return HashedEmbeddings(dimension=dimension)
+    raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+
+
+def embedder_id(backend, model_name=None, dimension=512):
+    """Name of the backend's vector space without loading it, keys the embedding cache"""
+    if backend == "hashed":
+        return HashedEmbeddings(dimension=dimension).model_id
+    return model_name
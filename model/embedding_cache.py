@@ -0,0 +1,202 @@
+import os
+import sys
+import time
+import fcntl
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from utils.exception import CustomException
+from utils.logger import logging
+from utils.offload import OffloadQueueFull, run_cpu_bound
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store keyed by hash(model name + text).
+
+    Vectors live in an append-only float32 matrix on disk ({path}.f32) whose row order
+    matches the key file ({path}.keys, first line is the dimension). An in-memory LRU
+    sits in front of it, and the wrapped embedding model is only called for texts that
+    were never seen before. Exposes embed_documents/embed_query so it can stand in for
+    the embedding model itself.
+    """
+
+    def __init__(self, model_name, store_path, embed_model_factory, lru_size=10000, offload=True):
+        self.model_name = model_name
+        # Run inference in the native thread pool; off for models that only do socket I/O
+        self.offload = offload
+        self.matrix_path = f"{store_path}.f32"
+        self.keys_path = f"{store_path}.keys"
+        self.embed_model_factory = embed_model_factory
+        self.lru_size = lru_size
+
+        self._embed_model = None
+        self.lru = OrderedDict()
+        self.rows = {}  # key -> row in the on-disk matrix
+        self.dimension = None
+        self.keys_offset = 0  # bytes of the key file already read
+        self.matrix = None
+        self.lock = threading.RLock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(self.keys_path) or ".", exist_ok=True)
+        self._refresh_from_disk()
+
+    @property
+    def embed_model(self):
+        # Only pay for loading the model once something actually has to be embedded
+        if self._embed_model is None:
+            with self.lock:
+                if self._embed_model is None:
+                    self._embed_model = self.embed_model_factory()
+        return self._embed_model
+
+    def key_for(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "lru_entries": len(self.lru),
+            "stored_entries": len(self.rows)
+        }
+
+    def _refresh_from_disk(self):
+        """Pick up rows appended by this or other workers since the last read"""
+        if not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, "r") as f:
+            f.seek(self.keys_offset)
+            chunk = f.read()
+        # Ignore a trailing line another worker is still writing
+        complete = chunk[:chunk.rfind("\n") + 1]
+        if not complete:
+            return
+        self.keys_offset += len(complete.encode("utf-8"))
+
+        for line in complete.splitlines():
+            if self.dimension is None:
+                self.dimension = int(line)
+                continue
+            self.rows.setdefault(line, len(self.rows))
+        self.matrix = None  # reopened lazily with the new row count
+
+    def _read_row(self, row):
+        if self.matrix is None or self.matrix.shape[0] <= row:
+            self.matrix = np.memmap(
+                self.matrix_path, dtype="float32", mode="r",
+                shape=(len(self.rows), self.dimension)
+            )
+        return np.array(self.matrix[row])
+
+    def _remember(self, key, vector):
+        self.lru[key] = vector
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    def _lookup(self, key):
+        vector = self.lru.get(key)
+        if vector is not None:
+            self.lru.move_to_end(key)
+            return vector
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        vector = self._read_row(row)
+        self.disk_hits += 1
+        self._remember(key, vector)
+        return vector
+
+    def _append(self, keys, vectors):
+        """Append new rows under an exclusive lock so workers never interleave writes"""
+        with open(self.keys_path, "a+") as keys_file:
+            while True:
+                try:
+                    fcntl.flock(keys_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    # Polled rather than blocking so an eventlet worker keeps serving meanwhile
+                    time.sleep(0.01)
+            try:
+                self._refresh_from_disk()
+                # Drop a key line left half-written by a writer that died mid-append
+                keys_file.truncate(self.keys_offset)
+                if self.dimension is None:
+                    keys_file.write(f"{vectors.shape[1]}\n")
+                    keys_file.flush()
+                    # Read back as the header, so it is never taken for a row key
+                    self._refresh_from_disk()
+                new = [(key, vector) for key, vector in zip(keys, vectors) if key not in self.rows]
+                if new:
+                    with open(self.matrix_path, "ab") as matrix_file:
+                        # Drop rows left behind by a writer that died before recording their keys
+                        matrix_file.truncate(len(self.rows) * self.dimension * 4)
+                        matrix_file.write(np.asarray([v for _, v in new], dtype="float32").tobytes())
+                    keys_file.write("".join(f"{key}\n" for key, _ in new))
+                keys_file.flush()
+                self._refresh_from_disk()
+            finally:
+                fcntl.flock(keys_file, fcntl.LOCK_UN)
+
+    def embed_documents(self, texts):
+        """
+        Embeddings for texts as a float32 matrix, computing only unseen texts in one batch.
+        The lock is released while the model runs, so concurrent callers queue at the
+        offloader rather than here; a text embedded twice meanwhile is stored once.
+        """
+        try:
+            with self.lock:
+                keys = [self.key_for(text) for text in texts]
+                vectors = {}
+                for key in keys:
+                    vector = self._lookup(key)
+                    if vector is not None:
+                        vectors[key] = vector
+
+                missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+                if missing:
+                    # Another worker may have embedded some of them already
+                    self._refresh_from_disk()
+                    for key in list(missing):
+                        vector = self._lookup(key)
+                        if vector is not None:
+                            vectors[key] = vector
+                            missing.pop(key)
+
+            if missing:
+                new_keys = list(missing)
+                new_texts = [missing[key] for key in new_keys]
+                if self.offload:
+                    new_vectors = run_cpu_bound(self.embed_model.embed_documents, new_texts)
+                else:
+                    new_vectors = self.embed_model.embed_documents(new_texts)
+                new_vectors = np.asarray(new_vectors, dtype="float32")
+                with self.lock:
+                    self._append(new_keys, new_vectors)
+                    for key, vector in zip(new_keys, new_vectors):
+                        self._remember(key, vector)
+                        vectors[key] = vector
+
+            with self.lock:
+                self.misses += len(missing)
+                self.hits += len(keys) - len(missing)
+            if not keys:
+                return np.zeros((0, self.dimension or 0), dtype="float32")
+            return np.asarray([vectors[key] for key in keys], dtype="float32")
+        except OffloadQueueFull:
+            raise
+        except Exception as e:
+            logging.error(f"Error in embedding cache: {e}")
+            raise CustomException(e, sys)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -0,0 +1,153 @@
+"""
+Local embedding service that owns the only copy of the embedding model.
+
+Gunicorn starts it once next to the workers (see gunicorn.conf.py) when
+EMBEDDING_SERVICE_SOCKET is set. Workers talk to it over a Unix socket through
+EmbeddingServiceClient, so memory no longer grows with the worker count and a
+restarted worker never reloads torch. It can also be run on its own:
+
+    python -m model.embedding_service --socket /tmp/safarsaathi-embeddings.sock
+
+Wire format, both directions length-prefixed:
+    request:  >I length + JSON {"texts": [...]}
+    response: >II rows, dimension + rows * dimension float32 values
+"""
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import threading
+import socket
+import socketserver
+import numpy as np
+from utils.exception import CustomException
+from utils.logger import logging
+
+
+def _recv_exactly(connection, size):
+    chunks = []
+    while size:
+        chunk = connection.recv(size)
+        if not chunk:
+            raise ConnectionError("Embedding service connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class _EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                length, = struct.unpack(">I", _recv_exactly(self.request, 4))
+            except ConnectionError:
+                return
+            try:
+                texts = json.loads(_recv_exactly(self.request, length))["texts"]
+                vectors = self.server.encode(texts)
+            except Exception as e:
+                # Dropping the connection makes the client raise instead of waiting forever
+                logging.error(f"Error in embedding service request: {e}")
+                return
+            self.request.sendall(struct.pack(">II", *vectors.shape) + vectors.tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, model_name):
+        from model.embedders import create_embedder
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        started = time.monotonic()
+        self.embed_model = create_embedder("huggingface", model_name)
+        logging.info(f"Embedding service loaded {model_name} in {time.monotonic() - started:.1f}s")
+        # One forward pass at a time, torch already parallelises inside a batch
+        self.encode_lock = threading.Lock()
+        super().__init__(socket_path, _EmbeddingRequestHandler)
+
+    def encode(self, texts):
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        with self.encode_lock:
+            vectors = self.embed_model.embed_documents(texts)
+        return np.asarray(vectors, dtype="float32")
+
+
+class EmbeddingServiceClient:
+    """Drop-in for HuggingFaceEmbeddings that forwards batches to the embedding service"""
+
+    def __init__(self, socket_path, connect_timeout=60):
+        self.socket_path = socket_path
+        self.connect_timeout = connect_timeout
+        self.local = threading.local()  # one connection per thread / greenlet
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            return connection
+        # The service may still be loading the model right after a deploy
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                connection.connect(self.socket_path)
+                self.local.connection = connection
+                return connection
+            except (FileNotFoundError, ConnectionRefusedError):
+                connection.close()
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+    def _close(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def embed_documents(self, texts):
+        payload = json.dumps({"texts": list(texts)}).encode("utf-8")
+        for attempt in range(2):
+            try:
+                connection = self._connection()
+                connection.sendall(struct.pack(">I", len(payload)) + payload)
+                rows, dimension = struct.unpack(">II", _recv_exactly(connection, 8))
+                data = _recv_exactly(connection, rows * dimension * 4)
+                return np.frombuffer(data, dtype="float32").reshape(rows, dimension)
+            except (ConnectionError, OSError) as e:
+                # Reconnect once in case the service was restarted
+                self._close()
+                if attempt:
+                    logging.error(f"Error calling embedding service at {self.socket_path}: {e}")
+                    raise CustomException(e, sys)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def main():
+    from config.config import EMBEDDING_MODEL_NAME, EMBEDDING_SERVICE_SOCKET
+
+    parser = argparse.ArgumentParser(description="Serve profile embeddings over a Unix socket")
+    parser.add_argument("--socket", default=EMBEDDING_SERVICE_SOCKET)
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    args = parser.parse_args()
+    if not args.socket:
+        parser.error("--socket or EMBEDDING_SERVICE_SOCKET is required")
+
+    server = EmbeddingServer(args.socket, args.model)
+    logging.info(f"Embedding service listening on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import json
+from datetime import datetime
+from config.config import RECOMMENDATION_CACHE_TTL_SECONDS, RECOMMENDATION_CACHE_SIZE, REDIS_URL
+from utils.logger import logging
+from utils.ttl_cache import TTLCache
+
+
+class _LocalBackend(TTLCache):
+    """LRU of user_id -> value inside this worker"""
+
+    name = "local"
+
+    def __init__(self, max_entries):
+        super().__init__(max_entries, ttl_seconds=0)
+
+    def count(self):
+        return len(self)
+
+
+class _RedisBackend:
+    """Shared by every worker, so an invalidation in one worker is seen by all of them"""
+
+    name = "redis"
+    prefix = "recommendations:"
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, user_id):
+        raw = self.client.get(f"{self.prefix}{user_id}")
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, user_id, value, ttl_seconds):
+        self.client.set(f"{self.prefix}{user_id}", json.dumps(value), ex=max(int(ttl_seconds), 1))
+
+    def delete(self, user_ids):
+        user_ids = list(user_ids)
+        # Bounded DEL commands, the batch job invalidates every user at once
+        for start in range(0, len(user_ids), 1000):
+            self.client.delete(*(f"{self.prefix}{user_id}" for user_id in user_ids[start:start + 1000]))
+
+    def count(self):
+        return sum(1 for _ in self.client.scan_iter(match=f"{self.prefix}*", count=1000))
+
+
+class RecommendationCache:
+    """
+    A user's stored recommendation list, cached by user_id for ttl_seconds so repeated
+    feed opens skip the database. Entries are dropped when the user's profile changes,
+    when they swipe or match (a candidate left the list) or when a new list is stored.
+    Uses Redis when redis_url is set, otherwise an LRU in each worker. Cache failures
+    are logged and treated as misses, the database stays the source of truth.
+    """
+
+    def __init__(self, ttl_seconds, max_entries, redis_url=None):
+        self.ttl_seconds = ttl_seconds
+        self.backend = _RedisBackend(redis_url) if redis_url else _LocalBackend(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl_seconds > 0
+
+    def get(self, user_id):
+        """Cached {"recommendations": [...], "generated_at": datetime or None}, or None"""
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(user_id)
+        except Exception as e:
+            logging.error(f"Error reading recommendation cache for user_id {user_id}: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        generated_at = value["generated_at"]
+        return {
+            "recommendations": value["recommendations"],
+            "generated_at": datetime.fromisoformat(generated_at) if generated_at else None
+        }
+
+    def set(self, user_id, recommendations, generated_at):
+        if not self.enabled:
+            return
+        value = {
+            "recommendations": recommendations,
+            "generated_at": generated_at.isoformat() if generated_at else None
+        }
+        try:
+            self.backend.set(user_id, value, self.ttl_seconds)
+        except Exception as e:
+            logging.error(f"Error writing recommendation cache for user_id {user_id}: {e}")
+
+    def invalidate(self, *user_ids):
+        if not self.enabled:
+            return
+        try:
+            self.backend.delete(user_ids)
+            self.invalidations += len(user_ids)
+        except Exception as e:
+            logging.error(f"Error invalidating recommendation cache for user_ids {user_ids}: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            entries = self.backend.count()
+        except Exception as e:
+            logging.error(f"Error counting recommendation cache entries: {e}")
+            entries = None
+        return {
+            "backend": self.backend.name,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "entries": entries
+        }
+
+
+recommendation_cache = RecommendationCache(RECOMMENDATION_CACHE_TTL_SECONDS, RECOMMENDATION_CACHE_SIZE, REDIS_URL)
@@ -1,181 +1,548 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from sqlalchemy import text
 from config.config import *
+from model.vector_index import UserVectorIndex
+from model.reranker import HybridReranker, interest_ids
+from model.embedding_cache import EmbeddingCache
+from model.embedding_service import EmbeddingServiceClient
+from model.embedders import create_embedder, embedder_id
+from model.recommendation_cache import recommendation_cache
+from database.pool import db_pool
+from utils.batch_worker import BatchWorker
+from utils.metrics import LatencyStats, size_bucket
+from utils.offload import OffloadQueueFull
 from utils.exception import CustomException
 from utils.logger import logging
 import sys
-import psycopg2
-from langchain.schema import Document
-from psycopg2.extras import DictCursor
+import time
+import threading
+from psycopg2.extras import execute_values
 import json
 
 
 class RecommendationModel:
     DEFAULT_RECOMMENDATION_LIMIT = 50  # Fixed limit for recommendations
+
+    # Shared by every RecommendationModel in the process so the model and index load once
+    _embedding_cache = None
+    _vector_index = None
+    _init_lock = threading.Lock()
+    # store_recommendations latency keyed by power-of-two batch size
+    store_latency = LatencyStats()
+    reranker = HybridReranker()
     
-    def __init__(self):
+    @property
+    def embed_model(self):
+        """Embedding cache in front of the embedding backend, which is loaded only on a cache miss"""
+        if RecommendationModel._embedding_cache is None:
+            with RecommendationModel._init_lock:
+                if RecommendationModel._embedding_cache is None:
+                    RecommendationModel._embedding_cache = EmbeddingCache(
+                        model_name=embedder_id(EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, HASHED_EMBEDDING_DIMENSION),
+                        store_path=EMBEDDING_CACHE_PATH,
+                        embed_model_factory=RecommendationModel.create_embed_model,
+                        lru_size=EMBEDDING_CACHE_SIZE,
+                        # The embedding service client only waits on its socket, which eventlet already greens,
+                        # and hashed embeddings cost less than a thread pool hop
+                        offload=EMBEDDING_BACKEND == "huggingface" and not EMBEDDING_SERVICE_SOCKET
+                    )
+        return RecommendationModel._embedding_cache
+
+    @staticmethod
+    def create_embed_model():
+        """Shared embedding service when one is configured, otherwise the backend inside this worker"""
+        if EMBEDDING_BACKEND == "huggingface" and EMBEDDING_SERVICE_SOCKET:
+            return EmbeddingServiceClient(EMBEDDING_SERVICE_SOCKET)
+        return create_embedder(EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, HASHED_EMBEDDING_DIMENSION)
+
+    @classmethod
+    def embedding_cache_stats(cls):
+        return cls._embedding_cache.stats() if cls._embedding_cache else {}
+
+    @classmethod
+    def cache_stats(cls):
+        """Hit rates and sizes of the caches in front of the database and the embedding model, plus pool usage"""
+        return {
+            "recommendations": recommendation_cache.stats(),
+            "embeddings": cls.embedding_cache_stats(),
+            "store_latency": cls.store_latency.snapshot(),
+            "database_pool": db_pool.stats()
+        }
+
+    @classmethod
+    def load_vector_index(cls):
+        """Process-wide vector index as saved on disk, may still be empty"""
+        if cls._vector_index is None:
+            with cls._init_lock:
+                if cls._vector_index is None:
+                    index = UserVectorIndex(
+                        VECTOR_INDEX_PATH,
+                        index_type=VECTOR_INDEX_TYPE,
+                        nlist=VECTOR_INDEX_NLIST,
+                        nprobe=VECTOR_INDEX_NPROBE,
+                        pq_m=VECTOR_INDEX_PQ_M,
+                        compact_after=VECTOR_INDEX_COMPACT_AFTER
+                    )
+                    index.load()
+                    cls._vector_index = index
+        return cls._vector_index
+
+    @property
+    def vector_index(self):
+        """Process-wide vector index, built once on first use if nothing was saved yet"""
+        index = self.load_vector_index()
+        if not index.is_ready():
+            with index.writes():
+                # Another worker may have built it while this one waited for the lock
+                if not index.is_ready():
+                    self.rebuild_vector_index()
+        else:
+            index.reload_if_changed()
+        return index
+
+    @staticmethod
+    def profile_text(city, interests):
+        """Text that gets embedded for a profile"""
+        # Convert list to comma-separated string if needed
+        if isinstance(interests, (list, set)):
+            interests = ', '.join(interests)
+        return f"user has city {city} and love {interests}"
+
+    @staticmethod
+    def profile_metadata(username, city, interests, content, updated_at):
+        """Index entry of a profile, updated_at is when the profile row was last saved (epoch seconds)"""
+        return {
+            "username": username,
+            "city": city,
+            "interests": interests,
+            "text": content,
+            "interest_ids": interest_ids(interests),
+            "updated_at": float(updated_at or 0)
+        }
+
+    def rebuild_vector_index(self):
+        """Embed every complete profile and replace the on-disk index"""
         try:
-            self.embed_model = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-mpnet-base-v2"
-            )            
-            self.connection = psycopg2.connect(
-                host=POSTGRES_HOST,
-                database=POSTGRES_DB,
-                user=POSTGRES_USER,
-                password=POSTGRES_PASSWORD,
-                port=POSTGRES_PORT
-            )
-            self.cursor = self.connection.cursor(cursor_factory=DictCursor)
+            with db_pool.cursor() as cursor:
+                cursor.execute("""
+                    SELECT ud.username, ud.id, up.location, up.interest,
+                           EXTRACT(EPOCH FROM up.updated_at) AS updated_at
+                    FROM user_profile up
+                    JOIN user_db ud ON up.user_id = ud.id
+                    WHERE up.location IS NOT NULL AND up.interest IS NOT NULL;
+                """)
+                users = cursor.fetchall()
+            logging.info(f"Rebuilding vector index from {len(users)} profiles")
+
+            user_ids, texts, metadata = [], [], []
+            for user in users:
+                content = self.profile_text(user['location'], user['interest'])
+                user_ids.append(user['id'])
+                texts.append(content)
+                metadata.append(self.profile_metadata(
+                    user['username'], user['location'], user['interest'], content, user['updated_at']
+                ))
+
+            index = self.load_vector_index()
+            if texts:
+                vectors = self.embed_model.embed_documents(texts)
+                with index.writes():
+                    index.build(user_ids, vectors, metadata)
+                    index.save()
+            return index
         except Exception as e:
-            logging.info(f"Error while connecting to PostgreSQL or loading faiss index: {e}")
+            logging.error(f"Error rebuilding vector index: {e}")
             raise CustomException(e, sys)
+
+    def update_user_vector(self, user_id):
+        """Re-embed a single user after their location or interests changed"""
+        return self.update_user_vectors([user_id])
+
+    def update_user_vectors(self, user_ids):
+        """Embed the given users' current profiles in one batch and update their index entries"""
+        try:
+            user_ids = list(set(user_ids))
+            index = self.load_vector_index()
+            # Profiles are read under the write lock, so an older read is never written after a newer one
+            with index.writes():
+                with db_pool.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT ud.id, ud.username, up.location, up.interest,
+                               EXTRACT(EPOCH FROM up.updated_at) AS updated_at
+                        FROM user_profile up
+                        JOIN user_db ud ON up.user_id = ud.id
+                        WHERE ud.id = ANY(%s);
+                    """, (user_ids,))
+                    users = {user['id']: user for user in cursor.fetchall()}
+
+                complete = [user for user in users.values() if user['location'] and user['interest']]
+                texts = [self.profile_text(user['location'], user['interest']) for user in complete]
+                # Fill the embedding cache even if no index exists yet, the first build will hit it
+                vectors = self.embed_model.embed_documents(texts)
+                if not index.is_ready():
+                    return False
+
+                complete_ids = {user['id'] for user in complete}
+                removals = [
+                    user_id for user_id in user_ids if user_id in index.metadata and user_id not in complete_ids
+                ]
+                upserts = []
+                for user, content, vector in zip(complete, texts, vectors):
+                    metadata = self.profile_metadata(
+                        user['username'], user['location'], user['interest'], content, user['updated_at']
+                    )
+                    if index.metadata.get(user['id']) != metadata:
+                        upserts.append((user['id'], vector, metadata))
+                index.write(upserts, removals)
+            logging.info(f"Updated vector index entries for {len(user_ids)} users")
+            return True
+        except Exception as e:
+            logging.error(f"Error updating vectors for user_ids {user_ids}: {e}")
+            return False
     
+    def drain_profile_changes(self, batch_size=PROFILE_EMBEDDING_BATCH_SIZE):
+        """
+        Claim up to batch_size outbox rows, re-embed their users and drop those users' stored
+        recommendations, all in one transaction. Rows locked by another consumer are skipped,
+        and a failed batch rolls back so its rows are retried. The index write lock is held
+        until the claim commits, so concurrent drains in web workers and the consumer job write
+        one after another. Returns the number of rows.
+        """
+        try:
+            # An exception returns the connection uncommitted, which rolls the claim back
+            with db_pool.cursor() as cursor:
+                cursor.execute("""
+                    DELETE FROM profile_change_outbox
+                    WHERE id IN (
+                        SELECT id FROM profile_change_outbox
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING user_id;
+                """, (batch_size,))
+                rows = cursor.fetchall()
+                if not rows:
+                    cursor.connection.commit()
+                    return 0
+
+                user_ids = list({row['user_id'] for row in rows})
+                index = self.load_vector_index()
+                with index.writes():
+                    if not self.update_user_vectors(user_ids) and index.is_ready():
+                        raise RuntimeError(f"re-embedding {len(user_ids)} changed users failed")
+
+                    # Lists scored against the old profile are stale, the next feed request rebuilds them
+                    cursor.execute(
+                        "DELETE FROM user_recommendation_entries WHERE user_id = ANY(%s);", (user_ids,)
+                    )
+                    cursor.connection.commit()
+            recommendation_cache.invalidate(*user_ids)
+            logging.info(f"Drained {len(rows)} profile changes for {len(user_ids)} users")
+            return len(rows)
+        except Exception as e:
+            logging.error(f"Error draining profile change outbox: {e}")
+            raise CustomException(e, sys)
+
     def get_user_id(self, username):
         """Get user ID from username"""
         try:
             query = "SELECT id FROM user_db WHERE username = %s"
-            self.cursor.execute(query, (username,))
-            result = self.cursor.fetchone()
+            with db_pool.cursor() as cursor:
+                cursor.execute(query, (username,))
+                result = cursor.fetchone()
             return result['id'] if result else None
         except Exception as e:
             logging.error(f"Error getting user ID for username {username}: {str(e)}")
             return None
     
-    def store_recommendations(self, username, recommendations):
+    def store_recommendations(self, user_id, recommendations):
+        """Atomically replace the user's stored list with one multi-row insert"""
+        started = time.perf_counter()
         try:
-            # Get user_id for the current user
-            user_id = self.get_user_id(username)
-            if not user_id:
-                logging.error(f"User ID not found for username: {username}")
-                return False
-            
-            # First, delete existing recommendations for this user
+            rows = [
+                (user_id, rec['user_id'], rec['similarity_score'], idx + 1)  # rank starts from 1
+                for idx, rec in enumerate(recommendations)
+            ]
+
+            # Delete and insert commit together, readers never see an empty list
             delete_query = """
                 DELETE FROM user_recommendation_entries 
                 WHERE user_id = %s;
             """
-            self.cursor.execute(delete_query, (user_id,))
-            
-            # Insert new recommendations
             insert_query = """
                 INSERT INTO user_recommendation_entries 
                 (user_id, recommended_user_id, similarity_score, rank)
-                VALUES (%s, %s, %s, %s);
+                VALUES %s;
             """
-            
-            for idx, rec in enumerate(recommendations):
-                recommended_user_id = self.get_user_id(rec['username'])
-                if recommended_user_id:
-                    self.cursor.execute(
-                        insert_query, 
-                        (
-                            user_id, 
-                            recommended_user_id, 
-                            rec['similarity_score'],
-                            idx + 1  # rank starts from 1
-                        )
-                    )
-            
-            self.connection.commit()
-            logging.info(f"Stored recommendations for user: {username}")
+            with db_pool.cursor() as cursor:
+                cursor.execute(delete_query, (user_id,))
+                if rows:
+                    execute_values(cursor, insert_query, rows, page_size=len(rows))
+                cursor.connection.commit()
+            recommendation_cache.invalidate(user_id)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            RecommendationModel.store_latency.record(size_bucket(len(rows)), elapsed_ms)
+            logging.info(f"Stored {len(rows)} recommendations for user_id {user_id} in {elapsed_ms:.1f}ms")
             return True
             
         except Exception as e:
             logging.error(f"Error storing recommendations: {str(e)}")
-            self.connection.rollback()
             return False
-        
+
+    def get_excluded_user_ids(self, user_id):
+        """Ids the user already swiped on (recent swipe_logs or rolled-up swipe_history) or matched with, in one query"""
+        with db_pool.cursor() as cursor:
+            cursor.execute("""
+                SELECT target_user_id AS excluded_id FROM swipe_logs WHERE user_id = %s
+                UNION
+                SELECT target_user_id FROM swipe_history WHERE user_id = %s
+                UNION
+                SELECT user2_id FROM matches WHERE user1_id = %s
+                UNION
+                SELECT user1_id FROM matches WHERE user2_id = %s;
+            """, (user_id, user_id, user_id, user_id))
+            return {row['excluded_id'] for row in cursor.fetchall()}
+
+    def find_candidates(self, index, query_vector, k, excluded_ids, city=None):
+        """
+        Nearest k (user_id, distance) pairs not in excluded_ids. Searches the user's city
+        partition first and only widens to the global index when the city has fewer than
+        k fresh candidates, over-fetching until k are found or the index is exhausted.
+        """
+        local = index.search_partition(query_vector, k, city, excluded_ids) if city else []
+        if len(local) >= k:
+            return local
+
+        # The city's users found so far are not returned twice
+        excluded_ids = excluded_ids | {user_id for user_id, _ in local}
+        needed = k - len(local)
+        fetch = needed * RECOMMENDATION_OVERFETCH_FACTOR + len(excluded_ids)
+        while True:
+            results = index.search(query_vector, fetch)
+            fresh = [(user_id, score) for user_id, score in results if user_id not in excluded_ids]
+            if len(fresh) >= needed or len(results) < fetch:
+                return local + fresh[:needed]
+            fetch *= 2
+
+    def rerank(self, query_vector, interests, city, results, index):
+        """Final order of the candidate rows, blending similarity, interests, city, recency and diversity"""
+        if not results:
+            return []
+        order, _ = RecommendationModel.reranker.rerank(
+            self.DEFAULT_RECOMMENDATION_LIMIT,
+            query_vector=query_vector,
+            user_interest_ids=interest_ids(interests),
+            user_city=index.city_code(city),
+            **index.candidate_features(results)
+        )
+        return order
+
+    def query_stored_recommendations(self, user_id, cursor=None, limit=None):
+        """
+        Stored recommendations after cursor with the profile fields joined in, skipping anyone
+        swiped on or matched with since the list was stored. No limit returns the whole list.
+        Returns (recommendations, generated_at).
+        """
+        after_rank, after_user_id = cursor or (0, 0)
+        query = """
+            SELECT ure.rank, ure.recommended_user_id, ure.similarity_score, ure.created_at,
+                   ud.username, up.location, up.interest, up.age, up.gender,
+                   up.occupation, up.bio, up.profile_photo
+            FROM user_recommendation_entries ure
+            JOIN user_db ud ON ud.id = ure.recommended_user_id
+            LEFT JOIN user_profile up ON up.user_id = ure.recommended_user_id
+            WHERE ure.user_id = %s
+            AND (ure.rank, ure.recommended_user_id) > (%s, %s)
+            AND NOT EXISTS (
+                SELECT 1 FROM swipe_logs sl
+                WHERE sl.user_id = ure.user_id AND sl.target_user_id = ure.recommended_user_id
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM swipe_history sh
+                WHERE sh.user_id = ure.user_id AND sh.target_user_id = ure.recommended_user_id
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM matches m
+                WHERE m.user1_id = LEAST(ure.user_id, ure.recommended_user_id)
+                AND m.user2_id = GREATEST(ure.user_id, ure.recommended_user_id)
+            )
+            ORDER BY ure.rank, ure.recommended_user_id
+            LIMIT %s;
+        """
+        with db_pool.cursor() as db_cursor:
+            db_cursor.execute(query, (user_id, after_rank, after_user_id, limit))
+            rows = db_cursor.fetchall()
+
+        recommendations = [{
+            "username": row['username'],
+            "user_id": row['recommended_user_id'],
+            "city": row['location'],
+            "interests": row['interest'],
+            "age": row['age'],
+            "gender": row['gender'],
+            "occupation": row['occupation'],
+            "bio": row['bio'],
+            "profile_photo": row['profile_photo'],
+            "similarity_score": row['similarity_score'],
+            "rank": row['rank']
+        } for row in rows]
+
+        # Every row of a user's list is written together, so any row dates the whole list
+        generated_at = rows[0]['created_at'] if rows else None
+        return recommendations, generated_at
+
+    def filter_fresh(self, user_id, recommendations, limit):
+        """
+        First `limit` cached recommendations the user has not swiped on or matched with since
+        the list was cached. A swipe handled by another worker never reaches this worker's
+        cache, so every cached page is checked with one indexed query per `limit` candidates.
+        """
+        page = []
+        for start in range(0, len(recommendations), limit):
+            chunk = recommendations[start:start + limit]
+            candidate_ids = [rec["user_id"] for rec in chunk]
+            with db_pool.cursor() as cursor:
+                cursor.execute("""
+                    SELECT target_user_id AS excluded_id FROM swipe_logs
+                    WHERE user_id = %s AND target_user_id = ANY(%s)
+                    UNION
+                    SELECT target_user_id FROM swipe_history
+                    WHERE user_id = %s AND target_user_id = ANY(%s)
+                    UNION
+                    SELECT user2_id FROM matches WHERE user1_id = %s AND user2_id = ANY(%s)
+                    UNION
+                    SELECT user1_id FROM matches WHERE user2_id = %s AND user1_id = ANY(%s);
+                """, (user_id, candidate_ids) * 4)
+                excluded = {row['excluded_id'] for row in cursor.fetchall()}
+            page.extend(rec for rec in chunk if rec["user_id"] not in excluded)
+            if len(page) >= limit:
+                break
+        return page[:limit]
+
+    def get_stored_recommendations(self, user_id, cursor=None, limit=20):
+        """
+        One page of precomputed recommendations.
+        cursor is the (rank, recommended_user_id) of the last card the client has seen.
+        The whole list is cached per user, so paging and repeat feed opens only check the page
+        against swipes and matches made since.
+        """
+        try:
+            cached = recommendation_cache.get(user_id)
+            if cached is None and recommendation_cache.enabled:
+                recommendations, generated_at = self.query_stored_recommendations(user_id)
+                recommendation_cache.set(user_id, recommendations, generated_at)
+                cached = {"recommendations": recommendations, "generated_at": generated_at}
+
+            if cached is not None:
+                after = cursor or (0, 0)
+                remaining = [
+                    rec for rec in cached["recommendations"] if (rec["rank"], rec["user_id"]) > after
+                ]
+                page = self.filter_fresh(user_id, remaining, limit)
+                generated_at = cached["generated_at"]
+            else:
+                page, generated_at = self.query_stored_recommendations(user_id, cursor, limit)
+
+            next_cursor = None
+            if len(page) == limit:
+                next_cursor = (page[-1]['rank'], page[-1]['user_id'])
+
+            return {
+                "status": "success",
+                "recommendations": page,
+                "next_cursor": next_cursor,
+                "generated_at": generated_at
+            }
+        except Exception as e:
+            logging.error(f"Error getting stored recommendations: {e}")
+            return {"status": "error", "message": str(e)}
+
     def get_recommendations(self, username):
         try:
             # Get user profile data from PostgreSQL
             query = """
-                SELECT up.location, up.interest, ud.id as user_id
+                SELECT up.location, up.interest, ud.id as user_id,
+                       EXTRACT(EPOCH FROM up.updated_at) AS updated_at
                 FROM user_profile up
                 JOIN user_db ud ON up.user_id = ud.id
                 WHERE ud.username = %s;
             """
             logging.info(f"Querying user profile for username: {username}")
-            self.cursor.execute(query, (username,))
-            result = self.cursor.fetchone()
+            with db_pool.cursor() as cursor:
+                cursor.execute(query, (username,))
+                result = cursor.fetchone()
             logging.info(f"User profile found: {result}")
             
             if not result:
                 return {"error": "User profile not found"}, 404
                 
             # Format query string similar to training data
-            city, interests = result['location'], result['interest']
-            
-            # Convert list to comma-separated string if needed
-            if isinstance(interests, (list, set)):
-                interests = ', '.join(interests)
-            query_string = f"user has city {city} and love {interests}"
+            user_id, city, interests = result['user_id'], result['location'], result['interest']
+            query_string = self.profile_text(city, interests)
             logging.info(f"Query string for FAISS: {query_string}")
-            
-            # Get all users for recommendations
-            self.cursor.execute("""
-                SELECT ud.username, ud.id, up.location, up.interest
-                FROM user_profile up
-                JOIN user_db ud ON up.user_id = ud.id
-                WHERE ud.username != %s;
-            """, (username,))
 
-            users = self.cursor.fetchall()
-            logging.info(f"Found {len(users)} users for recommendations")
-            documents = []
+            index = self.vector_index
+            query_vector = self.embed_model.embed_query(query_string)
 
-            # Convert user data to FAISS-compatible format
-            for user in users:
-                user_username = user['username']
-                user_city = user['location']
-                user_interests = user['interest']
-                user_id = user['id']
-
-                if user_city and user_interests:  # Ensure data is not null
-                    doc = Document(
-                        page_content=f"user has city {user_city} and love {user_interests}",
-                        metadata={
-                            "username": user_username,
-                            "user_id": user_id,
-                            "city": user_city,
-                            "interests": user_interests
-                        }
-                    )
-                    documents.append(doc)
-            
-            logging.info(f"Created {len(documents)} documents for FAISS")
-
-            # Create and save vector store
-            vector_store = FAISS.from_documents(documents, self.embed_model)
-            # Get top N most similar users (N = min(DEFAULT_LIMIT, total_users))
-            k = min(self.DEFAULT_RECOMMENDATION_LIMIT, len(documents))
-            results = vector_store.similarity_search_with_score(query_string, k=k)
-            logging.info(f"Found top {k} similar users out of {len(documents)} total users")
+            # The query vector is the user's own document vector, keep the index entry fresh for free
+            if city and interests:
+                metadata = self.profile_metadata(username, city, interests, query_string, result['updated_at'])
+                if index.metadata.get(user_id) != metadata:
+                    index.write([(user_id, query_vector, metadata)])
+
+            # Skip the user themself and anyone they already swiped on or matched with
+            excluded_ids = self.get_excluded_user_ids(user_id)
+            excluded_ids.add(user_id)
+
+            # Top-M ANN candidates, re-ranked down to the final N
+            results = self.find_candidates(
+                index, query_vector, max(RERANK_CANDIDATES, self.DEFAULT_RECOMMENDATION_LIMIT), excluded_ids, city
+            )
+            results = [(candidate_id, score) for candidate_id, score in results if candidate_id in index.metadata]
+            logging.info(f"Found {len(results)} fresh similar users out of {len(index)} indexed users")
             
-            # Format recommendations and sort by similarity score
+            order = self.rerank(query_vector, interests, city, results, index)
             recommendations = []
-            for doc, score in results:
-                metadata = doc.metadata
+            for row in order:
+                candidate_id, score = results[row]
+                metadata = index.metadata[candidate_id]
                 recommendations.append({
                     "username": metadata["username"],
-                    "user_id": metadata["user_id"],
+                    "user_id": candidate_id,
                     "city": metadata["city"],
                     "interests": metadata["interests"],
                     "similarity_score": round(1 - score, 3)  # Convert distance to similarity score
                 })
             
-            # Sort recommendations by similarity score in descending order
-            recommendations.sort(key=lambda x: x['similarity_score'], reverse=True)
-            
             # Store recommendations in database
-            self.store_recommendations(username, recommendations)
+            self.store_recommendations(user_id, recommendations)
             
             # Add rank to recommendations
             for idx, rec in enumerate(recommendations):
                 rec['rank'] = idx + 1
             
             return {"recommendations": recommendations}, 200
+
+        except OffloadQueueFull as e:
+            logging.info(f"Recommendations for {username} rejected: {e}")
+            return {"error": str(e)}, 503
             
         except Exception as e:
             logging.error(f"Error in get_recommendations: {str(e)}")
-            return {"error": str(e)}, 500 
\ No newline at end of file
+            return {"error": str(e)}, 500
+
+
+def _refresh_profile_embeddings(user_ids):
+    """Drain the profile change outbox, the submitted ids only signal that it has new rows"""
+    model = RecommendationModel()
+    while model.drain_profile_changes() == PROFILE_EMBEDDING_BATCH_SIZE:
+        pass
+
+
+# Profile saves only enqueue the user, embeddings are computed here in batches
+profile_embedding_worker = BatchWorker(
+    "profile-embeddings",
+    _refresh_profile_embeddings,
+    max_batch_size=PROFILE_EMBEDDING_BATCH_SIZE,
+    max_wait_ms=PROFILE_EMBEDDING_BATCH_WAIT_MS
+)
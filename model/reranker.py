@@ -0,0 +1,131 @@
+import time
+import hashlib
+import numpy as np
+
+
+def interest_tokens(interests):
+    """Normalized interest set, "Hiking, food ,hiking" -> ["food", "hiking"]"""
+    if not interests:
+        return []
+    if isinstance(interests, (list, set, tuple)):
+        interests = ",".join(interests)
+    return sorted({token.strip().lower() for token in str(interests).split(",") if token.strip()})
+
+
+def interest_ids(interests):
+    """64-bit ids of the normalized interest tokens, stored with each indexed profile"""
+    return [
+        int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+        for token in interest_tokens(interests)
+    ]
+
+
+class HybridReranker:
+    """
+    Re-ranks the top-M ANN candidates in one NumPy pass.
+
+    The relevance score blends cosine similarity of the profile embeddings, Jaccard overlap
+    of the interest sets (as interest_ids), a same-city boost and an exponential decay on
+    when the profile was last saved. Cosine similarity is derived from the squared L2 search
+    distances and the candidates' vector norms, so no candidate vectors are read for scoring.
+    The final order applies an MMR-style diversity penalty so near-duplicate profiles are
+    spread out; it only reads the vectors of the best k * diversity_pool_factor candidates.
+    """
+
+    def __init__(self, cosine_weight=0.6, interest_weight=0.25, city_weight=0.1, recency_weight=0.05,
+                 recency_half_life_days=30.0, diversity=0.2, diversity_pool_factor=2):
+        self.cosine_weight = cosine_weight
+        self.interest_weight = interest_weight
+        self.city_weight = city_weight
+        self.recency_weight = recency_weight
+        self.recency_half_life = recency_half_life_days * 86400.0
+        self.diversity = diversity
+        self.diversity_pool_factor = diversity_pool_factor
+        self._masks = {}  # pool size -> strictly lower triangle, reused across requests
+
+    def interest_overlap(self, candidate_interest_ids, candidate_interest_counts, user_interest_ids):
+        """
+        Jaccard overlap of every candidate's interest set with the user's, without a per-candidate
+        loop. candidate_interest_ids holds all candidates' ids concatenated, candidate_interest_counts
+        how many belong to each.
+        """
+        lengths = np.asarray(candidate_interest_counts, dtype=np.int64)
+        if not user_interest_ids or not lengths.any():
+            return np.zeros(len(lengths), dtype=np.float32)
+
+        flat = np.asarray(candidate_interest_ids, dtype=np.int64)
+        # A user has a handful of interests, one compare each beats np.isin's sort
+        hits = np.zeros(len(flat), dtype=bool)
+        for interest_id in user_interest_ids:
+            hits |= flat == interest_id
+        # Each candidate's hit count is the difference of prefix sums at the ends of its slice
+        ends = np.cumsum(lengths)
+        prefix = np.concatenate(([0], np.cumsum(hits)))
+        overlap = prefix[ends] - prefix[ends - lengths]
+        union = lengths + len(user_interest_ids) - overlap
+        return (overlap / np.maximum(union, 1)).astype(np.float32)
+
+    @staticmethod
+    def cosine(query_vector, candidate_distances, candidate_norms):
+        """Cosine similarity from squared L2 distances, |q - c|^2 = |q|^2 + |c|^2 - 2 q.c"""
+        query_norm = float(np.linalg.norm(np.asarray(query_vector, dtype=np.float32)))
+        distances = np.asarray(candidate_distances, dtype=np.float32)
+        norms = np.asarray(candidate_norms, dtype=np.float32)
+        dot = (query_norm * query_norm + norms * norms - distances) / 2
+        return np.clip(dot / np.maximum(query_norm * norms, 1e-12), -1.0, 1.0)
+
+    def score(self, query_vector, candidate_distances, candidate_norms, candidate_interest_ids,
+              candidate_interest_counts, user_interest_ids, candidate_cities, user_city,
+              candidate_updated_at, now=None):
+        """
+        Blended relevance of every candidate. Cities are integer codes, user_city is the
+        requesting user's (UserVectorIndex.city_code), so the same-city test is one int compare.
+        """
+        now = time.time() if now is None else now
+        cosine = self.cosine(query_vector, candidate_distances, candidate_norms)
+        interests = self.interest_overlap(candidate_interest_ids, candidate_interest_counts, user_interest_ids)
+        same_city = np.asarray(candidate_cities, dtype=np.int32) == user_city
+        age = np.maximum(now - np.asarray(candidate_updated_at, dtype=np.float64), 0.0)
+        recency = np.exp2(-age / self.recency_half_life)
+
+        return (
+            self.cosine_weight * cosine
+            + self.interest_weight * interests
+            + self.city_weight * same_city
+            + self.recency_weight * recency
+        )
+
+    def _lower_mask(self, size):
+        mask = self._masks.get(size)
+        if mask is None:
+            mask = self._masks[size] = np.tri(size, k=-1, dtype=np.float32)
+        return mask
+
+    def select(self, scores, pool_vectors, candidate_norms, k):
+        """
+        MMR-style order of the best k candidates, returns row indices. pool_vectors(rows)
+        returns the vectors of the given candidate rows, candidate_norms their L2 norms. Each candidate in the pool is
+        penalized by its highest similarity to any better-scored candidate, which is one
+        masked matrix reduction instead of a greedy loop.
+        """
+        k = min(k, len(scores))
+        if k == 0 or self.diversity <= 0:
+            return np.argsort(-scores)[:k]
+
+        pool_size = min(len(scores), k * self.diversity_pool_factor)
+        pool = np.argpartition(-scores, pool_size - 1)[:pool_size]
+        pool = pool[np.argsort(-scores[pool])]
+        vectors = np.asarray(pool_vectors(pool), dtype=np.float32)
+        norms = np.maximum(np.asarray(candidate_norms, dtype=np.float32)[pool], 1e-12)
+        similarity = (vectors @ vectors.T) / np.outer(norms, norms)
+
+        # Row i only looks at the candidates ranked above it
+        penalty = (similarity * self._lower_mask(pool_size)).max(axis=1)
+
+        final = (1 - self.diversity) * scores[pool] - self.diversity * penalty
+        return pool[np.argsort(-final)[:k]]
+
+    def rerank(self, k, pool_vectors, **features):
+        """Row indices of the final top-k and the blended score of every candidate"""
+        scores = self.score(**features)
+        return self.select(scores, pool_vectors, features["candidate_norms"], k), scores
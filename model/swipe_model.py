@@ -1,60 +1,25 @@
 from config.config import *
 from utils.exception import CustomException
 from utils.logger import logging
+from model.recommendation_cache import recommendation_cache
+from model.swipe_quota import swipe_quota
+from utils.get_user_id import user_id_cache
 import sys
+import atexit
 import psycopg2
-from psycopg2.extras import DictCursor
+from collections import defaultdict
+from psycopg2.extras import execute_values
+from database.pool import db_pool
+from utils.batch_worker import BatchWorker
 from datetime import datetime, timedelta
 
 class SwipeModel:
-    DAILY_SWIPE_LIMIT = 10
-    
-    def __init__(self):
-        self.connection = None
-        self.cursor = None
-        
-    def get_db_connection(self):
-        """Get database connection"""
-        try:
-            if not self.connection or self.connection.closed:
-                self.connection = psycopg2.connect(
-                    host=POSTGRES_HOST,
-                    database=POSTGRES_DB,
-                    user=POSTGRES_USER,
-                    password=POSTGRES_PASSWORD,
-                    port=POSTGRES_PORT
-                )
-                self.cursor = self.connection.cursor(cursor_factory=DictCursor)
-        except Exception as e:
-            logging.error(f"Error connecting to database: {e}")
-            raise CustomException(e, sys)
-            
-    def close_connection(self):
-        """Close database connection"""
-        try:
-            if self.cursor:
-                self.cursor.close()
-            if self.connection:
-                self.connection.close()
-        except Exception as e:
-            logging.error(f"Error closing database connection: {e}")
-            
+    DAILY_SWIPE_LIMIT = SWIPE_DAILY_LIMIT
+
     def get_remaining_swipes(self, user_id):
         """Calculate remaining swipes for the day"""
         try:
-            self.get_db_connection()
-            # Get swipes made in the last 24 hours
-            query = """
-                SELECT COUNT(*) as swipe_count
-                FROM swipe_logs
-                WHERE user_id = %s
-                AND swiped_at > NOW() - INTERVAL '24 hours';
-            """
-            self.cursor.execute(query, (user_id,))
-            result = self.cursor.fetchone()
-            
-            swipes_used = result['swipe_count'] if result else 0
-            remaining_swipes = self.DAILY_SWIPE_LIMIT - swipes_used
+            remaining_swipes = swipe_quota.remaining(user_id)
             
             return {
                 "status": "success",
@@ -65,119 +30,353 @@ class SwipeModel:
         except Exception as e:
             logging.error(f"Error getting remaining swipes: {e}")
             return {"status": "error", "message": str(e)}
-        finally:
-            self.close_connection()
             
     def process_swipe(self, user_id, target_user_id, direction):
         """Process a swipe action and check for matches"""
+        token = None
         try:
-            self.get_db_connection()
-            # Check remaining swipes
-            remaining = self.get_remaining_swipes(user_id)
-            if remaining["status"] == "error":
-                return remaining
-                
-            if remaining["remaining_swipes"] <= 0:
+            # Reserve the swipe first, concurrent swipes of one user can never overshoot the limit
+            allowed, remaining_swipes, token = swipe_quota.acquire(user_id)
+            if not allowed:
                 return {
                     "status": "error",
                     "message": "Daily swipe limit reached"
                 }
-                
-            # Log the swipe
-            swipe_query = """
-                INSERT INTO swipe_logs (user_id, target_user_id, swipe_direction)
-                VALUES (%s, %s, %s)
-                RETURNING swipe_id;
-            """
-            self.cursor.execute(swipe_query, (user_id, target_user_id, direction))
-            swipe_id = self.cursor.fetchone()['swipe_id']
-            
-            # If right swipe, check for match
-            match_found = False
-            if direction == 'right':
-                # Check if target user has already swiped right
-                match_check_query = """
-                    SELECT swipe_id
-                    FROM swipe_logs
-                    WHERE user_id = %s 
-                    AND target_user_id = %s
-                    AND swipe_direction = 'right'
-                    AND swiped_at > NOW() - INTERVAL '7 days';
-                """
-                self.cursor.execute(match_check_query, (target_user_id, user_id))
-                existing_swipe = self.cursor.fetchone()
-                
-                if existing_swipe:
-                    # Create match
-                    match_query = """
-                        INSERT INTO matches (user1_id, user2_id)
-                        VALUES (%s, %s)
-                        ON CONFLICT (user1_id, user2_id) DO NOTHING
-                        RETURNING match_id;
-                    """
-                    # Ensure smaller ID is user1_id for consistency
-                    user1, user2 = sorted([user_id, target_user_id])
-                    self.cursor.execute(match_query, (user1, user2))
-                    match_result = self.cursor.fetchone()
-                    match_found = bool(match_result)
+
+            if direction == 'left' and SWIPE_WRITE_BEHIND and swipe_quota.tracks_pending:
+                # A left swipe can never match, acknowledge it now and write it with the next batch
+                left_swipe_writer.submit((user_id, target_user_id, token))
+                token = None
+                return {
+                    "status": "success",
+                    "swipe_id": None,
+                    "match_found": False,
+                    "match_id": None,
+                    "remaining_swipes": remaining_swipes
+                }
+
+            with db_pool.cursor() as cursor:
+                # Swipe, reciprocal check and match in one call, see database/migrations/005
+                cursor.execute(
+                    "SELECT new_swipe_id, new_match_id FROM record_swipe(%s, %s, %s::swipe_direction_enum);",
+                    (user_id, target_user_id, direction)
+                )
+                result = cursor.fetchone()
+                swipe_id = result['new_swipe_id']
+                match_found = result['new_match_id'] is not None
             
-            self.connection.commit()
+                cursor.connection.commit()
+                swipe_quota.confirm(user_id, token, swipe_id)
+                token = None
+                # The target left the swiper's list; a match also takes the swiper off the target's list
+                if match_found:
+                    recommendation_cache.invalidate(user_id, target_user_id)
+                else:
+                    recommendation_cache.invalidate(user_id)
             
-            return {
-                "status": "success",
-                "swipe_id": swipe_id,
-                "match_found": match_found,
-                "remaining_swipes": remaining["remaining_swipes"] - 1
-            }
+                return {
+                    "status": "success",
+                    "swipe_id": swipe_id,
+                    "match_found": match_found,
+                    "match_id": result['new_match_id'],
+                    "remaining_swipes": remaining_swipes
+                }
             
         except Exception as e:
-            if self.connection:
-                self.connection.rollback()
+            if token is not None:
+                swipe_quota.release(user_id, token)
             logging.error(f"Error processing swipe: {e}")
             return {"status": "error", "message": str(e)}
-        finally:
-            self.close_connection()
             
-    def get_matches(self, user_id):
-        """Get all active matches for a user"""
+    def process_swipe_batch(self, user_id, swipes):
+        """
+        Apply queued swipes in order, [(target_username, direction), ...]. Targets are resolved
+        with one query, the quota is reserved for the whole batch at once and every swipe and
+        match is written by one record_swipes call. Returns a result per item.
+        """
+        results = [None] * len(swipes)
+        tokens = []
         try:
-            self.get_db_connection()
-            query = """
-                SELECT 
-                    m.match_id,
-                    CASE 
-                        WHEN m.user1_id = %s THEN m.user2_id
-                        ELSE m.user1_id
-                    END as matched_user_id,
-                    ud.username as matched_username,
-                    up.location as matched_location,
-                    up.interest as matched_interests,
-                    m.matched_at,
-                    m.is_active
+            user_ids = user_id_cache.lookup_many(
+                [target_username for target_username, _ in swipes if isinstance(target_username, str)]
+            )
+
+            valid = []
+            for position, (target_username, direction) in enumerate(swipes):
+                target_user_id = user_ids.get(target_username) if isinstance(target_username, str) else None
+                if direction not in ('left', 'right'):
+                    results[position] = {"status": "error", "message": "direction must be left or right"}
+                elif target_user_id is None:
+                    results[position] = {"status": "error", "message": "User not found"}
+                elif target_user_id == user_id:
+                    results[position] = {"status": "error", "message": "Cannot swipe on yourself"}
+                else:
+                    valid.append((position, target_user_id, direction))
+
+            # The earliest swipes get the remaining quota, like replaying them one by one would
+            tokens, remaining_swipes = swipe_quota.acquire_many(user_id, len(valid))
+            for position, _, _ in valid[len(tokens):]:
+                results[position] = {"status": "error", "message": "Daily swipe limit reached"}
+            valid = valid[:len(tokens)]
+
+            matched_user_ids = []
+            if valid:
+                with db_pool.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT batch_index, new_swipe_id, new_match_id "
+                        "FROM record_swipes(%s, %s, %s::swipe_direction_enum[]);",
+                        (user_id, [target for _, target, _ in valid], [direction for _, _, direction in valid])
+                    )
+                    rows = cursor.fetchall()
+                    cursor.connection.commit()
+
+                committed = []
+                for row, (position, target_user_id, _), token in zip(rows, valid, tokens):
+                    match_found = row['new_match_id'] is not None
+                    if match_found:
+                        matched_user_ids.append(target_user_id)
+                    committed.append((token, row['new_swipe_id']))
+                    results[position] = {
+                        "status": "success",
+                        "swipe_id": row['new_swipe_id'],
+                        "match_found": match_found,
+                        "match_id": row['new_match_id']
+                    }
+                swipe_quota.confirm_many(user_id, committed)
+                tokens = []
+                recommendation_cache.invalidate(user_id, *matched_user_ids)
+
+            return {
+                "status": "success",
+                "results": [
+                    {"target_username": target_username, **result}
+                    for (target_username, _), result in zip(swipes, results)
+                ],
+                "remaining_swipes": remaining_swipes
+            }
+
+        except Exception as e:
+            swipe_quota.release(user_id, *tokens)
+            logging.error(f"Error processing swipe batch: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def get_match_events(self, match_ids):
+        """
+        [(user_id, payload), ...] telling both users of each new match about the other one.
+        The payload has the same fields as a get_matches entry.
+        """
+        if not match_ids:
+            return []
+        with db_pool.cursor() as cursor:
+            cursor.execute("""
+                SELECT m.match_id, m.user1_id, m.user2_id, m.matched_at, m.is_active,
+                       ud.id AS user_id, ud.username, up.location, up.interest
                 FROM matches m
-                JOIN user_db ud ON (
-                    CASE 
-                        WHEN m.user1_id = %s THEN ud.id = m.user2_id
-                        ELSE ud.id = m.user1_id
-                    END
-                )
-                JOIN user_profile up ON ud.id = up.user_id
-                WHERE (m.user1_id = %s OR m.user2_id = %s)
-                AND m.is_active = TRUE
-                ORDER BY m.matched_at DESC;
-            """
-            self.cursor.execute(query, (user_id, user_id, user_id, user_id))
-            matches = self.cursor.fetchall()
-            
+                JOIN user_db ud ON ud.id IN (m.user1_id, m.user2_id)
+                LEFT JOIN user_profile up ON up.user_id = ud.id
+                WHERE m.match_id = ANY(%s);
+            """, (list(match_ids),))
+            rows = cursor.fetchall()
+
+        events = []
+        for row in rows:
+            # Each row is one side of the match, sent to the user on the other side
+            recipient_id = row['user2_id'] if row['user_id'] == row['user1_id'] else row['user1_id']
+            events.append((recipient_id, {
+                "match_id": row['match_id'],
+                "matched_user_id": row['user_id'],
+                "matched_username": row['username'],
+                "matched_location": row['location'],
+                "matched_interests": row['interest'],
+                "matched_at": row['matched_at'].isoformat() if row['matched_at'] else None,
+                "is_active": row['is_active']
+            }))
+        return events
+
+    def get_matches_since(self, user_id, after_match_id=0, limit=50):
+        """Active matches with match_id above the cursor, oldest first, for catching up after a reconnect"""
+        try:
+            with db_pool.cursor() as cursor:
+                # One branch per side of the pair so each can use its own index
+                query = """
+                    SELECT
+                        m.match_id,
+                        m.matched_user_id,
+                        ud.username as matched_username,
+                        up.location as matched_location,
+                        up.interest as matched_interests,
+                        m.matched_at,
+                        m.is_active
+                    FROM (
+                        SELECT match_id, user2_id AS matched_user_id, matched_at, is_active
+                        FROM matches
+                        WHERE user1_id = %s AND match_id > %s AND is_active = TRUE
+                        UNION ALL
+                        SELECT match_id, user1_id AS matched_user_id, matched_at, is_active
+                        FROM matches
+                        WHERE user2_id = %s AND match_id > %s AND is_active = TRUE
+                    ) m
+                    JOIN user_db ud ON ud.id = m.matched_user_id
+                    LEFT JOIN user_profile up ON up.user_id = m.matched_user_id
+                    ORDER BY m.match_id
+                    LIMIT %s;
+                """
+                cursor.execute(query, (user_id, after_match_id, user_id, after_match_id, limit))
+                matches = [dict(match) for match in cursor.fetchall()]
+
             return {
                 "status": "success",
-                "matches": [dict(match) for match in matches]
+                "matches": matches,
+                "next_cursor": matches[-1]["match_id"] if matches else after_match_id
+            }
+
+        except Exception as e:
+            logging.error(f"Error getting matches since {after_match_id}: {e}")
+            return {"status": "error", "message": str(e)}
+
+    def matches_page_query(self, user_id, cursor=None, limit=MATCHES_PAGE_SIZE):
+        """
+        (query, params) of one page of active matches, newest first. One branch per side of
+        the pair, each reading at most `limit` rows from its (userN_id, matched_at, match_id)
+        index, so a page costs the same however many matches the user has.
+        cursor is the (matched_at, match_id) of the last match on the previous page.
+        """
+        keyset = "AND (matched_at, match_id) < (%s, %s)" if cursor else ""
+        branch_params = (user_id, *cursor, limit) if cursor else (user_id, limit)
+        query = f"""
+            SELECT
+                m.match_id,
+                m.matched_user_id,
+                ud.username as matched_username,
+                up.location as matched_location,
+                up.interest as matched_interests,
+                m.matched_at,
+                m.is_active
+            FROM (
+                (SELECT match_id, user2_id AS matched_user_id, matched_at, is_active
+                 FROM matches
+                 WHERE user1_id = %s AND is_active = TRUE {keyset}
+                 ORDER BY matched_at DESC, match_id DESC
+                 LIMIT %s)
+                UNION ALL
+                (SELECT match_id, user1_id AS matched_user_id, matched_at, is_active
+                 FROM matches
+                 WHERE user2_id = %s AND is_active = TRUE {keyset}
+                 ORDER BY matched_at DESC, match_id DESC
+                 LIMIT %s)
+            ) m
+            JOIN user_db ud ON ud.id = m.matched_user_id
+            LEFT JOIN user_profile up ON up.user_id = m.matched_user_id
+            ORDER BY m.matched_at DESC, m.match_id DESC
+            LIMIT %s;
+        """
+        return query, branch_params * 2 + (limit,)
+
+    def get_matches(self, user_id, cursor=None, limit=MATCHES_PAGE_SIZE):
+        """Get a page of active matches for a user, newest first, after a cursor from an earlier page"""
+        try:
+            with db_pool.cursor() as db_cursor:
+                if cursor:
+                    # The keyset compares values, so a cursor that was never one of the user's matches
+                    # would page from an arbitrary point instead of failing
+                    db_cursor.execute("""
+                        SELECT 1 FROM matches
+                        WHERE match_id = %s AND matched_at = %s AND %s IN (user1_id, user2_id);
+                    """, (cursor[1], cursor[0], user_id))
+                    if not db_cursor.fetchone():
+                        return {"status": "error", "message": "Invalid cursor, no such match"}
+                query, params = self.matches_page_query(user_id, cursor, limit)
+                db_cursor.execute(query, params)
+                matches = [dict(match) for match in db_cursor.fetchall()]
+
+            next_cursor = None
+            if len(matches) == limit:
+                last = matches[-1]
+                next_cursor = f"{last['matched_at'].isoformat()}:{last['match_id']}"
+            return {
+                "status": "success",
+                "matches": matches,
+                "next_cursor": next_cursor
             }
             
         except Exception as e:
             logging.error(f"Error getting matches: {e}")
             return {"status": "error", "message": str(e)}
-        finally:
-            self.close_connection()
-            
-    
\ No newline at end of file
+
+
+def _insert_left_swipes(cursor, batch):
+    return execute_values(
+        cursor,
+        "INSERT INTO swipe_logs (user_id, target_user_id, swipe_direction) VALUES %s RETURNING swipe_id;",
+        [(user_id, target_user_id) for user_id, target_user_id, _ in batch],
+        template="(%s, %s, 'left')",
+        page_size=len(batch),
+        fetch=True
+    )
+
+
+def _insert_left_swipes_one_by_one(batch):
+    """Insert each swipe behind a savepoint so rows the database rejects do not sink the batch"""
+    written, rejected = [], []
+    with db_pool.cursor() as cursor:
+        for item in batch:
+            cursor.execute("SAVEPOINT left_swipe;")
+            try:
+                written.append((item, _insert_left_swipes(cursor, [item])[0]))
+                cursor.execute("RELEASE SAVEPOINT left_swipe;")
+            except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT left_swipe;")
+                rejected.append(item)
+                logging.error(f"Dropping buffered left swipe {item[0]} -> {item[1]}: {e}")
+        cursor.connection.commit()
+    return written, rejected
+
+
+def write_left_swipes(batch):
+    """
+    Insert buffered (user_id, target_user_id, quota token) left swipes with one statement and
+    commit. If a row is rejected (e.g. the target was deleted) the batch is written row by row
+    and only the rejected swipes are dropped, their quota given back. Connection errors are
+    raised so left_swipe_writer retries the batch.
+    """
+    try:
+        with db_pool.cursor() as cursor:
+            rows = _insert_left_swipes(cursor, batch)
+            cursor.connection.commit()
+        written, rejected = list(zip(batch, rows)), []
+    except (psycopg2.IntegrityError, psycopg2.DataError):
+        written, rejected = _insert_left_swipes_one_by_one(batch)
+
+    committed = defaultdict(list)
+    for (user_id, _, token), row in written:
+        committed[user_id].append((token, row['swipe_id']))
+    for user_id, pairs in committed.items():
+        swipe_quota.confirm_many(user_id, pairs)
+    # Only now can a refilled cache entry see the swipes
+    recommendation_cache.invalidate(*committed)
+    for user_id, _, token in rejected:
+        swipe_quota.release(user_id, token)
+
+
+def log_lost_left_swipes(batch):
+    """Swipes still unwritten when the worker shuts down, logged so they can be replayed"""
+    logging.error(
+        f"Lost {len(batch)} buffered left swipes: "
+        + ", ".join(f"{user_id} -> {target_user_id}" for user_id, target_user_id, _ in batch)
+    )
+
+
+# Per-worker write-behind buffer of left swipes, flushed every SWIPE_WRITE_BEHIND_MAX_WAIT_MS or
+# SWIPE_WRITE_BEHIND_MAX_ROWS swipes and on shutdown (gunicorn worker_exit, atexit otherwise).
+# Failed batches are retried with backoff until they are written.
+left_swipe_writer = BatchWorker(
+    "left-swipe-writer",
+    write_left_swipes,
+    max_batch_size=SWIPE_WRITE_BEHIND_MAX_ROWS,
+    max_wait_ms=SWIPE_WRITE_BEHIND_MAX_WAIT_MS,
+    retry=True,
+    on_failure=log_lost_left_swipes
+)
+atexit.register(left_swipe_writer.flush)
+if SWIPE_WRITE_BEHIND and not swipe_quota.tracks_pending:
+    logging.error("SWIPE_WRITE_BEHIND needs the redis or memory swipe quota, left swipes are written directly")
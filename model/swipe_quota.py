@@ -0,0 +1,378 @@
+"""
+Daily swipe quota as a sliding window of swipe times per user.
+
+Each user's window holds one member per swipe in the last window_seconds. A swipe first
+acquires a pending "t:<token>" member, which is atomic against concurrent swipes of the
+same user. After the swipe_logs row commits, the member is renamed to "s:<swipe_id>",
+and it is released if the insert fails. A window missing from the store is seeded from
+swipe_logs first, so a restart or eviction never hands out a fresh quota.
+jobs/reconcile_swipe_quotas rebuilds the Redis windows from swipe_logs periodically.
+
+Without Redis the window is counted in swipe_logs under a per-user advisory lock instead,
+which holds for any number of workers. Windows kept in process memory are only correct
+for a single worker and must be chosen explicitly.
+
+Checks cost O(limit), never a scan of swipe_logs.
+"""
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from flask import has_app_context
+from config.config import (
+    REDIS_URL, SWIPE_DAILY_LIMIT, SWIPE_QUOTA_BACKEND, SWIPE_QUOTA_WINDOW_SECONDS, SWIPE_QUOTA_CACHE_SIZE
+)
+from database.pool import db_pool
+from utils.ttl_cache import TTLCache
+from utils.logger import logging
+
+
+class _MemoryQuotaStore:
+    """Windows kept in this process, for a single worker and for tests"""
+
+    name = "memory"
+    tracks_pending = True
+
+    def __init__(self, max_users, window_seconds):
+        # A window untouched for window_seconds is empty anyway, expiring it forces a reseed
+        self.windows = TTLCache(max_users, window_seconds)
+        self.lock = threading.Lock()
+
+    def _window(self, user_id, cutoff):
+        window = self.windows.get(user_id)
+        if window is None:
+            return None
+        for member in [member for member, swiped_at in window.items() if swiped_at <= cutoff]:
+            del window[member]
+        return window
+
+    def seed(self, user_id, entries, window_seconds):
+        with self.lock:
+            if self.windows.get(user_id) is None:
+                self.windows.set(user_id, OrderedDict(entries))
+
+    def replace(self, user_id, entries, window_seconds, keep_pending_after):
+        with self.lock:
+            window = self.windows.get(user_id) or {}
+            pending = [(m, t) for m, t in window.items() if m.startswith("t:") and t > keep_pending_after]
+            self.windows.set(user_id, OrderedDict(entries + pending))
+
+    def acquire(self, user_id, members, now, cutoff, limit, window_seconds):
+        with self.lock:
+            window = self._window(user_id, cutoff)
+            if window is None:
+                return None, 0
+            granted = max(min(len(members), limit - len(window)), 0)
+            for member in members[:granted]:
+                window[member] = now
+            if granted:
+                self.windows.set(user_id, window)
+            return granted, len(window)
+
+    def rename(self, user_id, renames):
+        with self.lock:
+            window = self.windows.get(user_id)
+            for member, new_member in renames:
+                if window is not None and member in window:
+                    window[new_member] = window.pop(member)
+
+    def release(self, user_id, members):
+        with self.lock:
+            window = self.windows.get(user_id)
+            for member in members:
+                if window is not None:
+                    window.pop(member, None)
+
+    def used(self, user_id, cutoff):
+        with self.lock:
+            window = self._window(user_id, cutoff)
+            return None if window is None else len(window)
+
+
+# The "seeded" member (score +inf) marks a window loaded from swipe_logs and is never trimmed
+_SEED = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+redis.call('ZADD', KEYS[1], '+inf', 'seeded')
+for i = 2, #ARGV, 2 do redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1]) end
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+_REPLACE = """
+local pending = {}
+for _, member in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[2], '(inf')) do
+    if string.sub(member, 1, 2) == 't:' then
+        table.insert(pending, member)
+        table.insert(pending, redis.call('ZSCORE', KEYS[1], member))
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZADD', KEYS[1], '+inf', 'seeded')
+for i = 3, #ARGV, 2 do redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1]) end
+for i = 1, #pending, 2 do redis.call('ZADD', KEYS[1], pending[i + 1], pending[i]) end
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# Grants as many of the members as the limit leaves room for, in order
+_ACQUIRE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return {-1, 0} end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+local used = redis.call('ZCARD', KEYS[1]) - 1
+local granted = math.max(math.min(#ARGV - 4, tonumber(ARGV[3]) - used), 0)
+for i = 1, granted do redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4 + i]) end
+if granted > 0 then redis.call('PEXPIRE', KEYS[1], ARGV[4]) end
+return {granted, used + granted}
+"""
+
+_RENAME = """
+for i = 1, #ARGV, 2 do
+    local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+    if score then
+        redis.call('ZREM', KEYS[1], ARGV[i])
+        redis.call('ZADD', KEYS[1], score, ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+
+class _RedisQuotaStore:
+    """Windows shared by every worker as sorted sets scored by swipe time, updated by Lua scripts"""
+
+    name = "redis"
+    prefix = "swipe_quota:"
+    tracks_pending = True
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.seed_script = self.client.register_script(_SEED)
+        self.replace_script = self.client.register_script(_REPLACE)
+        self.acquire_script = self.client.register_script(_ACQUIRE)
+        self.rename_script = self.client.register_script(_RENAME)
+
+    def _key(self, user_id):
+        return f"{self.prefix}{user_id}"
+
+    @staticmethod
+    def _flatten(entries):
+        return [value for member, swiped_at in entries for value in (swiped_at, member)]
+
+    def seed(self, user_id, entries, window_seconds):
+        self.seed_script(keys=[self._key(user_id)], args=[int(window_seconds * 1000)] + self._flatten(entries))
+
+    def replace(self, user_id, entries, window_seconds, keep_pending_after):
+        self.replace_script(
+            keys=[self._key(user_id)],
+            args=[int(window_seconds * 1000), keep_pending_after] + self._flatten(entries)
+        )
+
+    def acquire(self, user_id, members, now, cutoff, limit, window_seconds):
+        granted, used = self.acquire_script(
+            keys=[self._key(user_id)], args=[now, cutoff, limit, int(window_seconds * 1000)] + list(members)
+        )
+        return (None if granted == -1 else granted), used
+
+    def rename(self, user_id, renames):
+        self.rename_script(keys=[self._key(user_id)], args=[value for pair in renames for value in pair])
+
+    def release(self, user_id, members):
+        self.client.zrem(self._key(user_id), *members)
+
+    def used(self, user_id, cutoff):
+        key = self._key(user_id)
+        pipeline = self.client.pipeline()
+        pipeline.exists(key)
+        pipeline.zcount(key, f"({cutoff}", "(inf")
+        exists, used = pipeline.execute()
+        return used if exists else None
+
+
+class _DatabaseQuotaStore:
+    """
+    Counts the window in swipe_logs on the (user_id, swiped_at) index. acquire() takes a
+    per-user transaction-level advisory lock on the request's connection, held until the
+    swipe's INSERT commits or rolls back, so concurrent swipes of one user are counted one
+    after the other whichever worker handles them. Reservations are the inserted rows
+    themselves, so there is nothing to seed, rename or release.
+    """
+
+    name = "database"
+    tracks_pending = False
+    # Single-key advisory locks, separate from record_swipe's two-key pair locks
+    LOCK_NAMESPACE = 0x5357 << 32
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+
+    def _count(self, cursor, user_id):
+        cursor.execute("""
+            SELECT COUNT(*) AS used
+            FROM swipe_logs
+            WHERE user_id = %s AND swiped_at > LOCALTIMESTAMP - make_interval(secs => %s);
+        """, (user_id, self.window_seconds))
+        return cursor.fetchone()['used']
+
+    def seed(self, user_id, entries, window_seconds):
+        pass
+
+    def replace(self, user_id, entries, window_seconds, keep_pending_after):
+        pass
+
+    def acquire(self, user_id, members, now, cutoff, limit, window_seconds):
+        if not has_app_context():
+            # The lock would be released with the connection, before the swipe is inserted
+            raise RuntimeError("The database swipe quota needs the swipe's request connection")
+        with db_pool.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s);", (self.LOCK_NAMESPACE + user_id,))
+            used = self._count(cursor, user_id)
+        granted = max(min(len(members), limit - used), 0)
+        return granted, used + granted
+
+    def rename(self, user_id, renames):
+        pass
+
+    def release(self, user_id, members):
+        pass
+
+    def used(self, user_id, cutoff):
+        with db_pool.cursor() as cursor:
+            return self._count(cursor, user_id)
+
+
+def create_quota_store(backend, window_seconds, redis_url=None, max_users=100000):
+    if backend == "redis":
+        return _RedisQuotaStore(redis_url)
+    if backend == "database":
+        return _DatabaseQuotaStore(window_seconds)
+    if backend == "memory":
+        return _MemoryQuotaStore(max_users, window_seconds)
+    raise ValueError(f"Unknown swipe quota backend {backend!r}, expected redis, database or memory")
+
+
+class SwipeQuota:
+    """
+    At most `limit` swipes per user in any window_seconds. loader(user_id) returns the
+    user's (swipe_id, swiped_at epoch seconds) rows inside the window from swipe_logs.
+    """
+
+    # Pending members younger than this survive a reconcile, the swipe may still commit
+    PENDING_GRACE_SECONDS = 60
+
+    def __init__(self, limit, window_seconds, loader, backend="database", redis_url=None, max_users=100000):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.loader = loader
+        self.store = create_quota_store(backend, window_seconds, redis_url, max_users)
+        self.seeds = 0
+        self.rejections = 0
+
+    @property
+    def tracks_pending(self):
+        """Whether reservations count before their swipe_logs row exists, needed for buffered writes"""
+        return self.store.tracks_pending
+
+    def _entries(self, rows):
+        return [(f"s:{swipe_id}", swiped_at) for swipe_id, swiped_at in rows]
+
+    def _seed(self, user_id):
+        self.seeds += 1
+        self.store.seed(user_id, self._entries(self.loader(user_id)), self.window_seconds)
+
+    def remaining(self, user_id):
+        cutoff = time.time() - self.window_seconds
+        used = self.store.used(user_id, cutoff)
+        if used is None:
+            self._seed(user_id)
+            used = self.store.used(user_id, cutoff) or 0
+        return max(self.limit - used, 0)
+
+    def acquire_many(self, user_id, count):
+        """Reserve up to count swipes in one atomic step, returns (tokens, remaining)"""
+        tokens = [f"t:{uuid.uuid4().hex}" for _ in range(count)]
+        for _ in range(2):
+            now = time.time()
+            granted, used = self.store.acquire(
+                user_id, tokens, now, now - self.window_seconds, self.limit, self.window_seconds
+            )
+            if granted is not None:
+                break
+            self._seed(user_id)
+        else:
+            raise RuntimeError(f"Swipe quota window for user_id {user_id} could not be loaded")
+        self.rejections += count - granted
+        return tokens[:granted], max(self.limit - used, 0)
+
+    def acquire(self, user_id):
+        """Reserve one swipe, returns (allowed, remaining, token); release or confirm the token afterwards"""
+        tokens, remaining = self.acquire_many(user_id, 1)
+        return (True, remaining, tokens[0]) if tokens else (False, 0, None)
+
+    def confirm(self, user_id, token, swipe_id):
+        """The swipe committed, key the window entry by its swipe_logs row"""
+        self.confirm_many(user_id, [(token, swipe_id)])
+
+    def confirm_many(self, user_id, committed):
+        """[(token, swipe_id), ...] of committed swipes"""
+        try:
+            self.store.rename(user_id, [(token, f"s:{swipe_id}") for token, swipe_id in committed])
+        except Exception as e:
+            # The pending members still count, reconcile replaces them once they are past the grace period
+            logging.error(f"Error confirming swipe quota entries for user_id {user_id}: {e}")
+
+    def release(self, user_id, *tokens):
+        """The swipes were not recorded, give the reserved swipes back"""
+        if not tokens:
+            return
+        try:
+            self.store.release(user_id, tokens)
+        except Exception as e:
+            logging.error(f"Error releasing swipe quota entries for user_id {user_id}: {e}")
+
+    def reconcile(self, rows_by_user):
+        """Rebuild windows from swipe_logs, {user_id: [(swipe_id, swiped_at), ...]}"""
+        keep_pending_after = time.time() - self.PENDING_GRACE_SECONDS
+        for user_id, rows in rows_by_user.items():
+            self.store.replace(user_id, self._entries(rows), self.window_seconds, keep_pending_after)
+        return len(rows_by_user)
+
+    def stats(self):
+        return {
+            "backend": self.store.name,
+            "limit": self.limit,
+            "window_seconds": self.window_seconds,
+            "seeds": self.seeds,
+            "rejections": self.rejections
+        }
+
+
+def load_recent_swipes(window_seconds, user_id=None):
+    """
+    {user_id: [(swipe_id, swiped_at epoch seconds), ...]} for swipes inside the window,
+    of one user or of everyone who swiped. Ages are computed by Postgres so the
+    TIMESTAMP column's session time zone never skews the window.
+    """
+    now = time.time()
+    with db_pool.cursor() as cursor:
+        cursor.execute("""
+            SELECT user_id, swipe_id, EXTRACT(EPOCH FROM (LOCALTIMESTAMP - swiped_at)) AS age_seconds
+            FROM swipe_logs
+            WHERE swiped_at > LOCALTIMESTAMP - make_interval(secs => %s)
+            AND (%s IS NULL OR user_id = %s);
+        """, (window_seconds, user_id, user_id))
+        rows = cursor.fetchall()
+    windows = {} if user_id is None else {user_id: []}
+    for row in rows:
+        windows.setdefault(row['user_id'], []).append((row['swipe_id'], now - float(row['age_seconds'])))
+    return windows
+
+
+swipe_quota = SwipeQuota(
+    SWIPE_DAILY_LIMIT,
+    SWIPE_QUOTA_WINDOW_SECONDS,
+    lambda user_id: load_recent_swipes(SWIPE_QUOTA_WINDOW_SECONDS, user_id)[user_id],
+    SWIPE_QUOTA_BACKEND,
+    REDIS_URL,
+    SWIPE_QUOTA_CACHE_SIZE
+)
@@ -1,41 +1,35 @@
-from config.config import POSTGRES_HOST, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_PORT
-import psycopg2
-from psycopg2.extras import DictCursor
+from database.pool import db_pool
 from utils.logger import logging
 from utils.exception import CustomException
 import sys
-from flask_jwt_extended import get_jwt_identity
+from utils.get_user_id import get_current_user_id
+from model.recommendation_model import profile_embedding_worker
 import json
 
 
 class UserOnboardingmodel:
-    def __init__(self):
-        try:
-            self.connection = psycopg2.connect(
-                host=POSTGRES_HOST,
-                database=POSTGRES_DB,
-                user=POSTGRES_USER,
-                password=POSTGRES_PASSWORD,
-                port=POSTGRES_PORT
-            )
-            self.cursor = self.connection.cursor(cursor_factory=DictCursor)
-        except Exception as e:
-            logging.info(f"Error while connecting to PostgreSQL database: {e}")
-            raise CustomException(e, sys)
-    
     def get_user_id(self):
         try:
             logging.info("Getting user id")
-            current_user = get_jwt_identity()
-            self.cursor.execute('SELECT id FROM user_db WHERE username = %s', (current_user,))
-            user = self.cursor.fetchone()
-            if not user:
-                return None
-            return user['id']
+            return get_current_user_id()
         except Exception as e:
             logging.error(f"Error in get_user_id: {e}")
             raise CustomException(e,sys)
 
+    def record_profile_change(self, cursor, user_id):
+        """Outbox row committed together with the profile update, so no change is ever lost"""
+        cursor.execute('''
+            INSERT INTO profile_change_outbox (user_id) VALUES (%s);
+            NOTIFY profile_changes;
+        ''', (user_id,))
+
+    def refresh_recommendation_vector(self, user_id):
+        """Wake this worker's outbox drain so the change is indexed within a second, never fails the profile write"""
+        try:
+            profile_embedding_worker.submit(user_id)
+        except Exception as e:
+            logging.error(f"Error refreshing recommendation vector: {e}")
+
     def add_age(self, age):
         try:
             logging.info("adding age")
@@ -48,13 +42,14 @@ class UserOnboardingmodel:
         
         try:
             logging.info("adding age to user_profile")
-            self.cursor.execute('''
-                INSERT INTO user_profile (user_id, age) 
-                VALUES (%s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET age = EXCLUDED.age
-            ''', (user_id, age))
-            self.connection.commit()
+            with db_pool.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO user_profile (user_id, age) 
+                    VALUES (%s, %s)
+                    ON CONFLICT (user_id) 
+                    DO UPDATE SET age = EXCLUDED.age
+                ''', (user_id, age))
+                cursor.connection.commit()
             logging.info("Age updated successfully")
             return {"status": "success"}
         except Exception as e:
@@ -74,13 +69,14 @@ class UserOnboardingmodel:
 
         try:
             logging.info("adding gender to user_profile")
-            self.cursor.execute('''
-                INSERT INTO user_profile (user_id, gender) 
-                VALUES (%s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET gender = EXCLUDED.gender
-            ''', (user_id, gender))
-            self.connection.commit()
+            with db_pool.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO user_profile (user_id, gender) 
+                    VALUES (%s, %s)
+                    ON CONFLICT (user_id) 
+                    DO UPDATE SET gender = EXCLUDED.gender
+                ''', (user_id, gender))
+                cursor.connection.commit()
             logging.info("Gender updated successfully")
             return {"status": "success"}
         except Exception as e:
@@ -100,14 +96,17 @@ class UserOnboardingmodel:
         
         try:
             logging.info("adding location to user_profile")
-            self.cursor.execute('''
-                INSERT INTO user_profile (user_id, location) 
-                VALUES (%s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET location = EXCLUDED.location
-            ''', (user_id, location))
-            self.connection.commit()
+            with db_pool.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO user_profile (user_id, location) 
+                    VALUES (%s, %s)
+                    ON CONFLICT (user_id) 
+                    DO UPDATE SET location = EXCLUDED.location
+                ''', (user_id, location))
+                self.record_profile_change(cursor, user_id)
+                cursor.connection.commit()
             logging.info("Location updated successfully")
+            self.refresh_recommendation_vector(user_id)
             return {"status": "success"}
         except Exception as e:
             logging.error(f"Error in update_location: {e}")
@@ -125,13 +124,14 @@ class UserOnboardingmodel:
         
         try:
             logging.info("adding occupation to user_profile")
-            self.cursor.execute('''
-                INSERT INTO user_profile (user_id, occupation) 
-                VALUES (%s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET occupation = EXCLUDED.occupation
-            ''', (user_id, occupation))
-            self.connection.commit()
+            with db_pool.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO user_profile (user_id, occupation) 
+                    VALUES (%s, %s)
+                    ON CONFLICT (user_id) 
+                    DO UPDATE SET occupation = EXCLUDED.occupation
+                ''', (user_id, occupation))
+                cursor.connection.commit()
             logging.info("Occupation updated successfully")
             return {"status": "success"}
         except Exception as e:
@@ -150,14 +150,17 @@ class UserOnboardingmodel:
         
         try:
             logging.info("adding interests to user_profile")
-            self.cursor.execute('''
-                INSERT INTO user_profile (user_id, interest) 
-                VALUES (%s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET interest = EXCLUDED.interest
-            ''', (user_id, interests))
-            self.connection.commit()
+            with db_pool.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO user_profile (user_id, interest) 
+                    VALUES (%s, %s)
+                    ON CONFLICT (user_id) 
+                    DO UPDATE SET interest = EXCLUDED.interest
+                ''', (user_id, interests))
+                self.record_profile_change(cursor, user_id)
+                cursor.connection.commit()
             logging.info("Interests updated successfully")
+            self.refresh_recommendation_vector(user_id)
             return {"status": "success"}
         except Exception as e:
             logging.error(f"Error in update_interests: {e}")
@@ -176,13 +179,14 @@ class UserOnboardingmodel:
         
         try:
             logging.info("adding bio to user_profile")
-            self.cursor.execute('''
-                INSERT INTO user_profile (user_id, bio) 
-                VALUES (%s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET bio = EXCLUDED.bio
-            ''', (user_id, bio))
-            self.connection.commit()
+            with db_pool.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO user_profile (user_id, bio) 
+                    VALUES (%s, %s)
+                    ON CONFLICT (user_id) 
+                    DO UPDATE SET bio = EXCLUDED.bio
+                ''', (user_id, bio))
+                cursor.connection.commit()
             return {"status": "success"}
         except Exception as e:
             logging.error(f"Error in update_bio: {e}")
@@ -200,13 +204,14 @@ class UserOnboardingmodel:
         
         try:
             # Save the video filename to the database
-            self.cursor.execute('''
-                INSERT INTO user_profile (user_id, videos) 
-                VALUES (%s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET videos = EXCLUDED.videos
-            ''', (user_id, json.dumps([filename])))
-            self.connection.commit()
+            with db_pool.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO user_profile (user_id, videos) 
+                    VALUES (%s, %s)
+                    ON CONFLICT (user_id) 
+                    DO UPDATE SET videos = EXCLUDED.videos
+                ''', (user_id, json.dumps([filename])))
+                cursor.connection.commit()
             logging.info("Videos updated successfully")
             return {"status": "success"}
         except Exception as e:
@@ -225,13 +230,14 @@ class UserOnboardingmodel:
         
         try:
             logging.info("adding prompt to user_profile")
-            self.cursor.execute('''
-                INSERT INTO user_profile (user_id, prompt) 
-                VALUES (%s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET prompt = EXCLUDED.prompt
-            ''', (user_id, prompt))
-            self.connection.commit()
+            with db_pool.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO user_profile (user_id, prompt) 
+                    VALUES (%s, %s)
+                    ON CONFLICT (user_id) 
+                    DO UPDATE SET prompt = EXCLUDED.prompt
+                ''', (user_id, prompt))
+                cursor.connection.commit()
             logging.info("Prompt updated successfully")
             return {"status": "success"}
         except Exception as e:
@@ -0,0 +1,604 @@
+import os
+import json
+import sys
+import time
+import fcntl
+import base64
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+import numpy as np
+import faiss
+from utils.exception import CustomException
+from utils.logger import logging
+from utils.offload import run_cpu_bound, run_maintenance
+from utils.rw_lock import ReadWriteLock
+
+
+def normalize_location(location):
+    """Partition key for a location, e.g. "  New Delhi, India" becomes "new delhi"."""
+    if not location:
+        return ""
+    return " ".join(str(location).split(",")[0].lower().split())
+
+
+class FeatureColumns:
+    """
+    Re-ranking inputs of the indexed users as columns, so a candidate list's features are
+    gathered with one fancy index per column instead of a lookup per candidate:
+        norms       float32 L2 norm of the vector as added
+        updated_at  float64 profile timestamp
+        cities      int32 code of the normalized location
+        interests   CSR, interest_start/interest_count of each row into one int64 array
+    row_of maps user_id -> row, -1 for users not indexed. A replaced profile's interests
+    are appended and a removed user's row is left behind, both are compacted away once
+    they outgrow the live data.
+    """
+
+    def __init__(self):
+        self.row_of = np.full(1024, -1, dtype=np.int64)
+        self.norms = np.zeros(1024, dtype=np.float32)
+        self.updated_at = np.zeros(1024, dtype=np.float64)
+        self.cities = np.zeros(1024, dtype=np.int32)
+        self.interest_start = np.zeros(1024, dtype=np.int64)
+        self.interest_count = np.zeros(1024, dtype=np.int64)
+        self.interests = np.zeros(4096, dtype=np.int64)
+        self.rows = 0  # rows in use, live or left behind
+        self.interests_used = 0
+        self.live_rows = 0
+        self.live_interests = 0
+        self.city_codes = {}  # normalized location -> code
+        self.city_names = []  # code -> normalized location
+
+    @staticmethod
+    def _grow(array, size, fill=0):
+        if size <= len(array):
+            return array
+        grown = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def row(self, user_id):
+        return int(self.row_of[user_id]) if 0 <= user_id < len(self.row_of) else -1
+
+    def city_code(self, key):
+        """Code of a normalized location, -1 when no indexed user has it"""
+        return self.city_codes.get(key, -1)
+
+    def city_of(self, user_id):
+        """Normalized location of an indexed user, None if not indexed"""
+        row = self.row(user_id)
+        return self.city_names[self.cities[row]] if row >= 0 else None
+
+    def add(self, user_id, key, norm, interest_ids, updated_at):
+        """Set a user's features, replacing any they had"""
+        row = self.row(user_id)
+        if row < 0:
+            row = self.rows
+            self.rows += 1
+            self.live_rows += 1
+            self.norms = self._grow(self.norms, self.rows)
+            self.updated_at = self._grow(self.updated_at, self.rows)
+            self.cities = self._grow(self.cities, self.rows)
+            self.interest_start = self._grow(self.interest_start, self.rows)
+            self.interest_count = self._grow(self.interest_count, self.rows)
+            self.row_of = self._grow(self.row_of, user_id + 1, fill=-1)
+            self.row_of[user_id] = row
+        else:
+            self.live_interests -= int(self.interest_count[row])
+
+        code = self.city_codes.get(key)
+        if code is None:
+            code = self.city_codes[key] = len(self.city_names)
+            self.city_names.append(key)
+        ids = np.asarray(interest_ids, dtype=np.int64)
+        end = self.interests_used + len(ids)
+        self.interests = self._grow(self.interests, end)
+        self.interests[self.interests_used:end] = ids
+        self.interest_start[row] = self.interests_used
+        self.interest_count[row] = len(ids)
+        self.interests_used = end
+        self.live_interests += len(ids)
+        self.norms[row] = norm
+        self.updated_at[row] = updated_at
+        self.cities[row] = code
+        self._compact_if_sparse()
+
+    def remove(self, user_id):
+        row = self.row(user_id)
+        if row < 0:
+            return
+        self.row_of[user_id] = -1
+        self.live_rows -= 1
+        self.live_interests -= int(self.interest_count[row])
+        self._compact_if_sparse()
+
+    def _interest_positions(self, rows):
+        """Positions in self.interests of the given rows' interests, concatenated, and each row's count"""
+        counts = self.interest_count[rows]
+        ends = np.cumsum(counts)
+        total = int(ends[-1]) if len(ends) else 0
+        # Each row's slice is an arange shifted from where it lands in the output to where it is stored
+        shift = np.repeat(self.interest_start[rows] - (ends - counts), counts)
+        return np.arange(total, dtype=np.int64) + shift, counts
+
+    def _compact_if_sparse(self):
+        if self.rows <= 2 * self.live_rows + 1024 and self.interests_used <= 2 * self.live_interests + 4096:
+            return
+        user_ids = np.flatnonzero(self.row_of >= 0)
+        rows = self.row_of[user_ids]
+        positions, counts = self._interest_positions(rows)
+        self.interests = self.interests[positions]
+        self.interest_start = np.cumsum(counts) - counts
+        self.interest_count = counts
+        self.norms = self.norms[rows]
+        self.updated_at = self.updated_at[rows]
+        self.cities = self.cities[rows]
+        self.row_of[user_ids] = np.arange(len(user_ids))
+        self.rows = self.live_rows = len(user_ids)
+        self.interests_used = self.live_interests = len(self.interests)
+
+    def gather(self, user_ids):
+        """Features of the given users, keyed like the arguments of HybridReranker.score"""
+        rows = self.row_of[user_ids]
+        positions, counts = self._interest_positions(rows)
+        return {
+            "candidate_norms": self.norms[rows],
+            "candidate_interest_ids": self.interests[positions],
+            "candidate_interest_counts": counts,
+            "candidate_cities": self.cities[rows],
+            "candidate_updated_at": self.updated_at[rows]
+        }
+
+
+class UserVectorIndex:
+    """
+    Long-lived FAISS index of profile embeddings, keyed by user_id and persisted to disk.
+
+    index_type selects the storage:
+        flat   - exact search over float32 vectors (default)
+        sq8    - exact search over int8 scalar-quantized vectors, 4x smaller
+        ivfsq8 - inverted lists over int8 vectors, searches nprobe of nlist cells
+        ivfpq  - inverted lists with product quantization, pq_m bytes per vector
+    IVF types start as a flat index while there are too few vectors to train them, and the
+    configured index is trained and swapped in at the first snapshot with enough vectors.
+    A snapshot built with other settings is rebuilt on load.
+
+    On disk a snapshot (the index plus a .meta.json user_id mapping) is followed by an
+    append-only change log, so a single user's update appends one line instead of rewriting
+    the index, and other processes replay the log tail instead of reloading everything.
+    Writers hold an exclusive flock on a .lock file, and once the log has compact_after
+    entries it is folded into a new snapshot.
+    """
+    INDEX_TYPES = ("flat", "sq8", "ivfsq8", "ivfpq")
+    # Older snapshots are rebuilt, version 2 adds vector norms and each profile's interest_ids and updated_at
+    FORMAT_VERSION = 2
+    MIN_TRAINING_POINTS_PER_CELL = 39
+    MIN_IVF_VECTORS = 1000
+    # 8-bit PQ codebooks have 256 centroids per sub-quantizer, each wants 39 training points
+    MIN_PQ_VECTORS = 256 * 39
+
+    def __init__(self, index_path, index_type="flat", nlist=0, nprobe=16, pq_m=48, compact_after=1000):
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(f"Unknown vector index type {index_type}, expected one of {self.INDEX_TYPES}")
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.index_path = index_path
+        self.metadata_path = f"{index_path}.meta.json"
+        self.lock_path = f"{index_path}.lock"
+        self.compact_after = compact_after
+        self.index = None
+        self.metadata = {}  # user_id -> {"username", "city", "interests", "text"}
+        self.partitions = defaultdict(set)  # normalized location -> user_ids
+        self.norms = {}  # user_id -> L2 norm of the vector as added, for cosine similarity from search distances
+        self.features = FeatureColumns()
+        self.selectors = {}  # normalized location -> IDSelectorBatch of its users, built on first search
+        self.loaded_mtime = None
+        self.generation = 0  # bumped by every snapshot, names the change log that follows it
+        self.log_offset = 0  # bytes of the change log applied here
+        self.log_entries = 0
+        self.lock = threading.RLock()  # Python-side state: metadata, partitions, log position
+        # Offloaded FAISS reads share it, in-place changes to self.index take it exclusively
+        self.index_lock = ReadWriteLock()
+        self.write_lock = threading.RLock()
+        self.writing = False  # this process holds the file lock
+
+    def __len__(self):
+        return self.index.ntotal if self.index is not None else 0
+
+    def is_ready(self):
+        return self.index is not None
+
+    def _partition(self, user_id, meta):
+        key = normalize_location(meta.get("city"))
+        self.partitions[key].add(user_id)
+        self.selectors.pop(key, None)
+        self.features.add(user_id, key, self.norms[user_id], meta["interest_ids"], meta["updated_at"])
+
+    def _rebuild_partitions(self):
+        self.partitions = defaultdict(set)
+        self.features = FeatureColumns()
+        self.selectors = {}
+        for user_id, meta in self.metadata.items():
+            self._partition(user_id, meta)
+
+    def _unpartition(self, user_id):
+        key = self.features.city_of(user_id)
+        if key is not None:
+            self.features.remove(user_id)
+            self.partitions[key].discard(user_id)
+            self.selectors.pop(key, None)
+            if not self.partitions[key]:
+                del self.partitions[key]
+
+    def partition(self, location):
+        """User ids indexed under the same normalized location"""
+        return self.partitions.get(normalize_location(location), set())
+
+    def city_code(self, location):
+        """Integer code candidate_features gives users indexed under location, -1 if there are none"""
+        return self.features.city_code(normalize_location(location))
+
+    def settings(self):
+        """Build settings saved with each snapshot, a snapshot with different ones is rebuilt"""
+        settings = {"index_type": self.index_type}
+        if self.index_type in ("ivfsq8", "ivfpq"):
+            settings["nlist"] = self.nlist
+        if self.index_type == "ivfpq":
+            settings["pq_m"] = self.pq_m
+        return settings
+
+    def _ivf_size(self, count):
+        """(nlist, vectors needed to train it) of an IVF index over count vectors"""
+        nlist = self.nlist or max(1, min(int(4 * np.sqrt(count)), count // self.MIN_TRAINING_POINTS_PER_CELL))
+        needed = max(nlist * self.MIN_TRAINING_POINTS_PER_CELL, self.MIN_IVF_VECTORS)
+        if self.index_type == "ivfpq":
+            needed = max(needed, self.MIN_PQ_VECTORS)
+        return nlist, needed
+
+    def _new_index(self, training_vectors):
+        """Empty index of the configured type, trained on training_vectors when needed"""
+        count, dimension = training_vectors.shape
+        if self.index_type == "sq8":
+            index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit))
+            index.train(training_vectors)
+            return index
+
+        if self.index_type in ("ivfsq8", "ivfpq"):
+            nlist, needed = self._ivf_size(count)
+            # Below a few thousand users a flat scan is as fast and exact
+            if count >= needed:
+                quantizer = faiss.IndexFlatL2(dimension)
+                if self.index_type == "ivfpq":
+                    index = faiss.IndexIVFPQ(quantizer, dimension, nlist, self.pq_m, 8)
+                else:
+                    index = faiss.IndexIVFScalarQuantizer(
+                        quantizer, dimension, nlist, faiss.ScalarQuantizer.QT_8bit
+                    )
+                index.train(training_vectors)
+                # IVF indexes take user ids directly, a hashtable direct map gives reconstruct/remove by id
+                index.set_direct_map_type(faiss.DirectMap.Hashtable)
+                self._apply_search_params(index)
+                return index
+            logging.info(
+                f"Only {count} vectors, need {needed} to train {self.index_type}, using a flat index"
+            )
+
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+
+    def _promote(self):
+        """Replace the flat index an IVF type started with by the trained IVF index once it can be trained"""
+        if self.index_type not in ("ivfsq8", "ivfpq") or faiss.try_extract_index_ivf(self.index) is not None:
+            return
+        count = self.index.ntotal
+        if count < self._ivf_size(count)[1]:
+            return
+        ids = faiss.vector_to_array(self.index.id_map)
+        vectors = self.index.index.reconstruct_n(0, count)
+        index = self._new_index(vectors)
+        index.add_with_ids(vectors, ids)
+        self.index = index
+        logging.info(f"Trained a {self.index_type} index on {count} vectors in place of the flat one")
+
+    def _apply_search_params(self, index):
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = self.nprobe
+
+    def _metadata_mtime(self):
+        try:
+            return os.stat(self.metadata_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _log_path(self):
+        return f"{self.index_path}.{self.generation}.log"
+
+    def load(self):
+        """Load the latest snapshot and replay its change log, returns False if nothing was saved yet"""
+        with self.lock:
+            # A snapshot replaced while it was being read is read again
+            for _ in range(3):
+                mtime = self._metadata_mtime()
+                if mtime is None or not os.path.exists(self.index_path):
+                    return False
+                try:
+                    index = faiss.read_index(self.index_path)
+                    with open(self.metadata_path, "r") as f:
+                        saved = json.load(f)
+                except Exception as e:
+                    logging.error(f"Error loading vector index from {self.index_path}: {e}")
+                    return False
+                if self._metadata_mtime() == mtime:
+                    break
+
+            if saved.get("version") != self.FORMAT_VERSION:
+                logging.info(f"Vector index at {self.index_path} is of an older format, it will be rebuilt")
+                return False
+            if saved.get("settings") != self.settings():
+                logging.info(
+                    f"Vector index at {self.index_path} was built with {saved.get('settings')}, "
+                    f"configured {self.settings()}, it will be rebuilt"
+                )
+                return False
+            self._apply_search_params(index)
+            self.index = index
+            self.metadata = {int(user_id): meta for user_id, meta in saved["users"].items()}
+            self.norms = {int(user_id): norm for user_id, norm in saved["norms"].items()}
+            self._rebuild_partitions()
+            self.loaded_mtime = mtime
+            self.generation = saved["generation"]
+            self.log_offset = 0
+            self.log_entries = 0
+            self._apply_log()
+            logging.info(f"Loaded vector index with {len(self)} users from {self.index_path}")
+            return True
+
+    def _apply_log(self):
+        """Replay change log lines appended since the last call, a half-written last line waits"""
+        try:
+            if os.stat(self._log_path()).st_size <= self.log_offset:
+                return
+            with open(self._log_path(), "rb") as f:
+                f.seek(self.log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            change = json.loads(line)
+            if change.get("removed"):
+                self.remove(change["user_id"])
+            else:
+                vector = np.frombuffer(base64.b64decode(change["vector"]), dtype="float32")
+                self.upsert(change["user_id"], vector, change["metadata"])
+            self.log_entries += 1
+        self.log_offset += end
+
+    def reload_if_changed(self):
+        """Pick up changes saved by other processes, a new snapshot is loaded whole"""
+        if self.writing:
+            # Nobody else can write while this process holds the lock, and its snapshot may be mid-save
+            return
+        mtime = self._metadata_mtime()
+        if mtime is not None and mtime != self.loaded_mtime:
+            self.load()
+        elif self.index is not None:
+            with self.lock:
+                self._apply_log()
+
+    @contextmanager
+    def writes(self):
+        """
+        Exclusive write access across processes, caught up with every earlier writer. Hold it
+        from reading the data being indexed until it is written so writers cannot reorder.
+        """
+        with self.write_lock:
+            if self.writing:
+                yield self
+                return
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        # Polled rather than blocking so an eventlet worker keeps serving meanwhile
+                        time.sleep(0.01)
+                self.reload_if_changed()
+                self.writing = True
+                yield self
+            finally:
+                self.writing = False
+                # Closing the descriptor releases the flock
+                os.close(fd)
+
+    def write(self, upserts=(), removals=()):
+        """
+        Append upserts [(user_id, vector, metadata)] and removed user_ids to the change log
+        and apply them here. Without a snapshot yet, or once the log is long, a snapshot is saved.
+        """
+        with self.writes():
+            lines = [json.dumps({"user_id": int(user_id), "removed": True}) for user_id in removals]
+            upserts = [
+                (int(user_id), np.asarray(vector, dtype="float32").reshape(-1), metadata)
+                for user_id, vector, metadata in upserts
+            ]
+            for user_id, vector, metadata in upserts:
+                lines.append(json.dumps({
+                    "user_id": user_id,
+                    "vector": base64.b64encode(vector.tobytes()).decode("ascii"),
+                    "metadata": metadata
+                }))
+            if not lines:
+                return
+
+            with self.lock:
+                for user_id in removals:
+                    self.remove(user_id)
+                for user_id, vector, metadata in upserts:
+                    self.upsert(user_id, vector, metadata)
+            if self.loaded_mtime is None or self.log_entries + len(lines) >= self.compact_after:
+                self._save()
+                return
+
+            data = ("\n".join(lines) + "\n").encode()
+            try:
+                with open(self._log_path(), "ab") as f:
+                    # Drop a line left half-written by a writer that died mid-append
+                    f.truncate(self.log_offset)
+                    f.write(data)
+            except Exception as e:
+                logging.error(f"Error appending to vector index log {self._log_path()}: {e}")
+                raise CustomException(e, sys)
+            self.log_offset += len(data)
+            self.log_entries += len(lines)
+
+    def save(self):
+        """Write a new snapshot, the change log so far is folded into it"""
+        with self.writes():
+            self._save()
+
+    def _save(self):
+        if self.index is None:
+            return
+        # Training and writing the whole index is CPU and disk bound, so it runs off the hub.
+        # Callers hold writes(), nothing in this process changes the index or metadata meanwhile
+        with self.index_lock.reading():
+            run_maintenance(self._write_snapshot)
+
+    def _write_snapshot(self):
+        try:
+            self._promote()
+            previous_log = self._log_path()
+            generation = self.generation + 1
+            # Unique per process, a stray writer cannot replace a half-written file
+            tmp_index_path = f"{self.index_path}.tmp.{os.getpid()}"
+            tmp_metadata_path = f"{self.metadata_path}.tmp.{os.getpid()}"
+            faiss.write_index(self.index, tmp_index_path)
+            with open(tmp_metadata_path, "w") as f:
+                json.dump({
+                    "version": self.FORMAT_VERSION,
+                    "generation": generation,
+                    "settings": self.settings(),
+                    "users": {str(user_id): meta for user_id, meta in self.metadata.items()},
+                    "norms": {str(user_id): norm for user_id, norm in self.norms.items()}
+                }, f)
+            os.replace(tmp_index_path, self.index_path)
+            # The metadata file is replaced last, its mtime marks a complete save
+            os.replace(tmp_metadata_path, self.metadata_path)
+            self.loaded_mtime = self._metadata_mtime()
+            self.generation = generation
+            self.log_offset = 0
+            self.log_entries = 0
+            if os.path.exists(previous_log):
+                os.remove(previous_log)
+            logging.info(f"Saved vector index with {len(self)} users to {self.index_path}")
+        except Exception as e:
+            logging.error(f"Error saving vector index to {self.index_path}: {e}")
+            raise CustomException(e, sys)
+
+    def build(self, user_ids, vectors, metadata):
+        """Replace the whole index with the given vectors"""
+        with self.lock:
+            vectors = np.asarray(vectors, dtype="float32")
+            index = self._new_index(vectors)
+            if len(user_ids):
+                index.add_with_ids(vectors, np.asarray(user_ids, dtype="int64"))
+            self.index = index
+            self.metadata = dict(zip(user_ids, metadata))
+            self.norms = dict(zip(user_ids, np.linalg.norm(vectors, axis=1).tolist())) if len(user_ids) else {}
+            self._rebuild_partitions()
+            logging.info(f"Built vector index with {len(self)} users")
+
+    def upsert(self, user_id, vector, metadata):
+        """Add or replace a single user's vector"""
+        with self.lock:
+            vector = np.asarray(vector, dtype="float32").reshape(1, -1)
+            if self.index is None:
+                self.index = self._new_index(vector)
+            ids = np.asarray([user_id], dtype="int64")
+            with self.index_lock.writing():
+                self.index.remove_ids(ids)
+                self.index.add_with_ids(vector, ids)
+            self._unpartition(user_id)
+            self.metadata[user_id] = metadata
+            self.norms[user_id] = float(np.linalg.norm(vector))
+            self._partition(user_id, metadata)
+
+    def remove(self, user_id):
+        with self.lock:
+            if self.index is not None:
+                with self.index_lock.writing():
+                    self.index.remove_ids(np.asarray([user_id], dtype="int64"))
+            self._unpartition(user_id)
+            self.metadata.pop(user_id, None)
+            self.norms.pop(user_id, None)
+
+    def vectors(self, user_ids):
+        """Stored vectors of the given users, approximate for the compressed index types"""
+        with self.index_lock.reading():
+            return self.index.reconstruct_batch(np.asarray(user_ids, dtype="int64"))
+
+    def candidate_features(self, results):
+        """
+        Re-ranking inputs for search results [(user_id, distance)], keyed like the arguments of
+        HybridReranker.rerank. Only the vectors the diversity pass asks for are read back.
+        """
+        user_ids, distances = (np.asarray(column) for column in zip(*results))
+        with self.lock:
+            features = self.features.gather(user_ids)
+        features["candidate_distances"] = distances
+        features["pool_vectors"] = lambda rows: self.vectors(user_ids[rows])
+        return features
+
+    def search(self, vector, k):
+        """Return up to k (user_id, distance) pairs closest to vector"""
+        index = self.index
+        if index is None or index.ntotal == 0:
+            return []
+        vector = np.asarray(vector, dtype="float32").reshape(1, -1)
+        # Only the read lock is held while the search waits in the thread pool
+        with self.index_lock.reading():
+            distances, ids = run_cpu_bound(index.search, vector, min(k, index.ntotal))
+        return [
+            (int(user_id), float(distance))
+            for user_id, distance in zip(ids[0], distances[0])
+            if user_id != -1
+        ]
+
+    def search_partition(self, vector, k, location, excluded_ids=()):
+        """
+        Nearest k (user_id, distance) pairs among the users indexed under location, skipping
+        excluded_ids. FAISS filters by the location's cached id selector while it searches,
+        so no vectors are copied out and a large city costs less than a global search.
+        """
+        key = normalize_location(location)
+        with self.lock:
+            members = self.partitions.get(key)
+            index = self.index
+            if index is None or not members:
+                return []
+            selector = self.selectors.get(key)
+            if selector is None:
+                selector = self.selectors[key] = faiss.IDSelectorBatch(
+                    np.fromiter(members, dtype="int64", count=len(members))
+                )
+            fetch = min(k + len(excluded_ids), len(members))
+
+        if faiss.try_extract_index_ivf(index) is not None:
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        vector = np.asarray(vector, dtype="float32").reshape(1, -1)
+        with self.index_lock.reading():
+            distances, ids = run_cpu_bound(index.search, vector, fetch, params=params)
+        return [
+            (int(user_id), float(distance))
+            for user_id, distance in zip(ids[0], distances[0])
+            if user_id != -1 and user_id not in excluded_ids
+        ][:k]
@@ -0,0 +1,105 @@
+import queue
+import threading
+import time
+from utils.logger import logging
+
+
+class _FlushMarker(threading.Event):
+    """Queued by flush(), set once every item queued before it has been handled"""
+
+
+class BatchWorker:
+    """
+    Collects submitted items and hands them to handler in batches from a background thread.
+    A batch is flushed once it reaches max_batch_size items or max_wait_ms after its first item.
+
+    With retry=True a failing batch is retried with exponential backoff (up to
+    max_backoff_seconds) until it succeeds, and only shutdown_attempts times once flush()
+    has been called. A batch that is given up on is passed to on_failure.
+    """
+
+    def __init__(self, name, handler, max_batch_size=100, max_wait_ms=500, retry=False,
+                 max_backoff_seconds=30, shutdown_attempts=3, on_failure=None):
+        self.name = name
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.retry = retry
+        self.max_backoff_seconds = max_backoff_seconds
+        self.shutdown_attempts = shutdown_attempts
+        self.on_failure = on_failure
+        self.queue = queue.Queue()
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.closing = False
+        self.failures = 0
+
+    def submit(self, item):
+        self._ensure_started()
+        self.queue.put(item)
+
+    def _ensure_started(self):
+        if self.thread is None:
+            with self.start_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self.thread.start()
+
+    def _collect(self, first_item):
+        """(batch, flush markers), a flush marker ends the batch early"""
+        batch, markers = [], []
+        item = first_item
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            if isinstance(item, _FlushMarker):
+                markers.append(item)
+                break
+            batch.append(item)
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.max_batch_size or remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+        return batch, markers
+
+    def _handle(self, batch):
+        delay, attempts = 0.1, 0
+        while True:
+            try:
+                self.handler(batch)
+                return
+            except Exception as e:
+                attempts += 1
+                if not self.retry or (self.closing and attempts >= self.shutdown_attempts):
+                    self.failures += 1
+                    logging.error(f"Error in {self.name} batch of {len(batch)} items, giving up: {e}")
+                    if self.on_failure is not None:
+                        self.on_failure(batch)
+                    return
+                logging.error(f"Error in {self.name} batch of {len(batch)} items, retrying in {delay:.1f}s: {e}")
+                # Shutdown waits on this, so back off briefly once closing
+                time.sleep(min(delay, 1) if self.closing else delay)
+                delay = min(delay * 2, self.max_backoff_seconds)
+
+    def _run(self):
+        while True:
+            batch, markers = self._collect(self.queue.get())
+            if batch:
+                self._handle(batch)
+            for marker in markers:
+                marker.set()
+
+    def flush(self, timeout=30):
+        """
+        Wait until every item submitted so far has been handed to handler, including the
+        batch being collected or written right now. Used on shutdown, so retries are cut
+        short from here on. Returns False on timeout or if any batch was given up on.
+        """
+        self.closing = True
+        if self.thread is None:
+            return self.failures == 0
+        marker = _FlushMarker()
+        self.queue.put(marker)
+        return marker.wait(timeout) and self.failures == 0
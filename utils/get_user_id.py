@@ -1,8 +1,66 @@
-from config.config import *
-import psycopg2
-from psycopg2.extras import DictCursor
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from config.config import USER_ID_CACHE_TTL_SECONDS, USER_ID_CACHE_SIZE
+from database.pool import db_pool
+from utils.ttl_cache import TTLCache
 from utils.logger import logging
 
+
+class UserIdCache(TTLCache):
+    """username -> user_id lookups, only found users are cached so new signups resolve at once"""
+
+    def __init__(self, max_entries, ttl_seconds):
+        super().__init__(max_entries, ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, username):
+        user_id = self.get(username)
+        if user_id is not None:
+            self.hits += 1
+            return user_id
+        self.misses += 1
+        with db_pool.cursor() as cursor:
+            # Query to get user ID
+            query = "SELECT id FROM user_db WHERE username = %s"
+            cursor.execute(query, (username,))
+            result = cursor.fetchone()
+        if result:
+            self.set(username, result['id'])
+        return result['id'] if result else None
+
+    def lookup_many(self, usernames):
+        """{username: user_id} of the usernames that exist, misses resolved with one query"""
+        found, missing = {}, []
+        for username in dict.fromkeys(usernames):
+            user_id = self.get(username)
+            if user_id is None:
+                missing.append(username)
+            else:
+                found[username] = user_id
+        self.hits += len(found)
+        self.misses += len(missing)
+        if missing:
+            with db_pool.cursor() as cursor:
+                cursor.execute("SELECT id, username FROM user_db WHERE username = ANY(%s)", (missing,))
+                rows = cursor.fetchall()
+            for row in rows:
+                self.set(row['username'], row['id'])
+                found[row['username']] = row['id']
+        return found
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self)
+        }
+
+
+user_id_cache = UserIdCache(USER_ID_CACHE_SIZE, USER_ID_CACHE_TTL_SECONDS)
+
+
 def get_user_id_from_username(username):
     """
     Utility function to get user_id from username
@@ -12,27 +70,19 @@ def get_user_id_from_username(username):
         int or None: User ID if found, None if not found or error occurs
     """
     try:
-        # Establish database connection
-        connection = psycopg2.connect(
-            host=POSTGRES_HOST,
-            database=POSTGRES_DB,
-            user=POSTGRES_USER,
-            password=POSTGRES_PASSWORD,
-            port=POSTGRES_PORT
-        )
-        cursor = connection.cursor(cursor_factory=DictCursor)
-        
-        # Query to get user ID
-        query = "SELECT id FROM user_db WHERE username = %s"
-        cursor.execute(query, (username,))
-        result = cursor.fetchone()
-        
-        # Close database connections
-        cursor.close()
-        connection.close()
-        
-        return result['id'] if result else None
+        return user_id_cache.lookup(username)
         
     except Exception as e:
         logging.error(f"Error getting user ID for username {username}: {str(e)}")
-        return None 
\ No newline at end of file
+        return None 
+
+
+def get_current_user_id():
+    """
+    User ID of the authenticated user, read from the token's user_id claim without a query.
+    Tokens issued before the claim existed fall back to the cached username lookup.
+    """
+    user_id = get_jwt().get("user_id")
+    if user_id is not None:
+        return user_id
+    return get_user_id_from_username(get_jwt_identity())
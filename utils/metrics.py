@@ -0,0 +1,35 @@
+import threading
+
+
+class LatencyStats:
+    """Running count / mean / max latency per label, cheap enough to record on every call"""
+
+    def __init__(self):
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, label, elapsed_ms):
+        with self.lock:
+            sample = self.samples.setdefault(label, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            sample["count"] += 1
+            sample["total_ms"] += elapsed_ms
+            sample["max_ms"] = max(sample["max_ms"], elapsed_ms)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                label: {
+                    "count": sample["count"],
+                    "avg_ms": round(sample["total_ms"] / sample["count"], 3),
+                    "max_ms": round(sample["max_ms"], 3)
+                }
+                for label, sample in self.samples.items()
+            }
+
+
+def size_bucket(size):
+    """Group sizes into power-of-two buckets: 0, 1, 2, 4, 8, ..."""
+    bucket = 1
+    while bucket < size:
+        bucket *= 2
+    return bucket if size else 0
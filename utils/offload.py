@@ -0,0 +1,64 @@
+import sys
+import threading
+from config.config import CPU_OFFLOAD_MAX_PENDING, CPU_OFFLOAD_WAIT_SECONDS
+from utils.logger import logging
+
+
+class OffloadQueueFull(Exception):
+    """Raised when too many CPU-bound calls are already queued for the thread pool"""
+
+
+class CpuOffloader:
+    """
+    Runs CPU-bound calls (model inference, FAISS search) in eventlet's native thread pool
+    so the hub keeps serving websockets and chat while they run. At most max_pending calls
+    may be running or queued; further callers wait up to wait_seconds for a slot and then
+    get OffloadQueueFull. Outside an eventlet-patched process calls run inline.
+    """
+
+    def __init__(self, max_pending, wait_seconds):
+        self.max_pending = max_pending
+        self.wait_seconds = wait_seconds
+        self.slots = None
+        self.rejected = 0
+
+    def _eventlet_active(self):
+        if "eventlet" not in sys.modules:
+            return False
+        from eventlet import patcher
+        return patcher.is_monkey_patched("thread")
+
+    def run(self, fn, *args, **kwargs):
+        if not self._eventlet_active():
+            return fn(*args, **kwargs)
+
+        from eventlet import tpool
+        if self.slots is None:
+            # Green semaphore: waiting for a slot only parks this greenlet
+            self.slots = threading.BoundedSemaphore(self.max_pending)
+        if not self.slots.acquire(timeout=self.wait_seconds):
+            self.rejected += 1
+            logging.info(f"CPU offload queue full ({self.max_pending} pending), rejecting {fn}")
+            raise OffloadQueueFull("Recommendation engine is busy, retry shortly")
+        try:
+            return tpool.execute(fn, *args, **kwargs)
+        finally:
+            self.slots.release()
+
+    def run_unbounded(self, fn, *args, **kwargs):
+        """Like run, but without taking a slot, for rare maintenance work that must not be rejected"""
+        if not self._eventlet_active():
+            return fn(*args, **kwargs)
+        from eventlet import tpool
+        return tpool.execute(fn, *args, **kwargs)
+
+
+cpu_offloader = CpuOffloader(CPU_OFFLOAD_MAX_PENDING, CPU_OFFLOAD_WAIT_SECONDS)
+
+
+def run_cpu_bound(fn, *args, **kwargs):
+    return cpu_offloader.run(fn, *args, **kwargs)
+
+
+def run_maintenance(fn, *args, **kwargs):
+    return cpu_offloader.run_unbounded(fn, *args, **kwargs)
@@ -0,0 +1,45 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """
+    Many readers or one writer. Readers may hold it across an offloaded call, so a FAISS
+    search in the thread pool never runs while the same index is modified in place. A
+    waiting writer stops new readers from entering so it is not starved.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writer = False
+        self.writers_waiting = 0
+
+    @contextmanager
+    def reading(self):
+        with self.condition:
+            while self.writer or self.writers_waiting:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self.condition:
+            self.writers_waiting += 1
+            while self.writer or self.readers:
+                self.condition.wait()
+            self.writers_waiting -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writer = False
+                self.condition.notify_all()
@@ -0,0 +1,41 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU whose entries also expire ttl_seconds after they were set"""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl_seconds, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.entries)